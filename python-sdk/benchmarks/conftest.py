@@ -0,0 +1,74 @@
+import os
+import sys
+import tracemalloc
+from typing import Any, Callable, List, Optional
+
+import pytest
+
+# Share the local stand-in backends with the test suite
+sys.path.insert(
+    0,
+    os.path.abspath(os.path.join(os.path.dirname(__file__), "../tests")),
+)
+
+from corpus import BENIGN_SENTENCES, MALICIOUS_SENTENCES  # noqa: E402
+from rebuff.detect_pi_classifier import (  # noqa: E402
+    PromptInjectionClassifier,
+    train_classifier,
+)
+from stubs import (  # noqa: E402
+    fake_vector_store,
+    make_sdk,
+    stub_api_server,
+    stub_openai_server,
+)
+
+
+@pytest.fixture(scope="session")
+def classifier() -> PromptInjectionClassifier:
+    # Trained on the short sentences only, so the longer buckets aren't memorized
+    texts = BENIGN_SENTENCES + MALICIOUS_SENTENCES
+    labels = [False] * len(BENIGN_SENTENCES) + [True] * len(MALICIOUS_SENTENCES)
+    return train_classifier(texts, labels)
+
+
+def run_corpus(detect: Callable[[str], Any], inputs: List[str]) -> List[Any]:
+    return [detect(user_input) for user_input in inputs]
+
+
+@pytest.fixture
+def bench_corpus(benchmark: Any) -> Callable[..., List[Any]]:
+    """
+    Benchmarks detect over every input of a corpus bucket and records throughput and peak memory alongside the
+    timings, so that all three are saved with each run. Peak memory is traced on the longest input only, since
+    tracing slows the code down considerably, or on memory_input if it is given.
+    """
+
+    def _bench_corpus(
+        detect: Callable[[str], Any],
+        inputs: List[str],
+        rounds: int = 5,
+        memory_input: Optional[str] = None,
+    ) -> List[Any]:
+        tracemalloc.start()
+        try:
+            detect(memory_input if memory_input is not None else max(inputs, key=len))
+            _, peak_memory = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        results: List[Any] = benchmark.pedantic(
+            run_corpus, args=(detect, inputs), rounds=rounds, iterations=1
+        )
+
+        benchmark.extra_info["inputs"] = len(inputs)
+        benchmark.extra_info["input_chars"] = sum(len(text) for text in inputs)
+        # stats is None when benchmarks are disabled and each test runs once
+        if benchmark.stats is not None:
+            benchmark.extra_info["inputs_per_second"] = round(
+                len(inputs) / benchmark.stats.stats.mean, 2
+            )
+        benchmark.extra_info["peak_memory_bytes"] = peak_memory
+        return results
+
+    return _bench_corpus
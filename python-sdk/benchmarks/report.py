@@ -0,0 +1,49 @@
+"""
+Compares the two most recent saved benchmark runs, including the throughput and memory figures that
+pytest-benchmark's own compare command does not show.
+
+Usage: python benchmarks/report.py [storage_dir]
+"""
+import json
+import sys
+from pathlib import Path
+from typing import Any, Dict, List
+
+
+def load_runs(storage: Path) -> List[Dict[str, Any]]:
+    paths = sorted(storage.glob("*/*.json"), key=lambda path: path.name)
+    return [json.loads(path.read_text()) for path in paths[-2:]]
+
+
+def change(old: float, new: float) -> str:
+    if not old:
+        return ""
+    return f"{(new - old) / old:+.1%}"
+
+
+def main() -> None:
+    storage = Path(sys.argv[1] if len(sys.argv) > 1 else ".benchmarks")
+    runs = load_runs(storage)
+    if len(runs) < 2:
+        print(f"Need at least two saved runs in {storage}, run 'make benchmark' first")
+        return
+
+    previous = {bench["fullname"]: bench for bench in runs[0]["benchmarks"]}
+    print(
+        f"{'benchmark':70} {'mean':>10} {'change':>8} {'inputs/s':>10} {'peak mem':>12} {'change':>8}"
+    )
+    for bench in runs[1]["benchmarks"]:
+        old = previous.get(bench["fullname"])
+        mean = bench["stats"]["mean"]
+        memory = bench["extra_info"].get("peak_memory_bytes", 0)
+        print(
+            f"{bench['name']:70} {mean * 1000:>8.2f}ms "
+            f"{change(old['stats']['mean'], mean) if old else 'new':>8} "
+            f"{bench['extra_info'].get('inputs_per_second', ''):>10} "
+            f"{memory:>12} "
+            f"{change(old['extra_info'].get('peak_memory_bytes', 0), memory) if old else 'new':>8}"
+        )
+
+
+if __name__ == "__main__":
+    main()
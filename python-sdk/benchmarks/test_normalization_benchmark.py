@@ -0,0 +1,23 @@
+from typing import Any, Callable, List
+
+import pytest
+
+from corpus import CORPUS
+from rebuff.detect_pi_heuristics import normalize_string
+from rebuff.prepared_input import PreparedInput, normalize_text
+
+NORMALIZERS = {
+    "regex": normalize_string,
+    "translate": normalize_text,
+    "prepared": lambda text: PreparedInput(text).tokens,
+}
+
+
+@pytest.mark.parametrize("normalizer", list(NORMALIZERS))
+@pytest.mark.parametrize("size", list(CORPUS))
+def test_normalize(benchmark: Any, size: str, normalizer: str) -> None:
+    inputs: List[str] = CORPUS[size]["benign"] + CORPUS[size]["malicious"]
+    normalize: Callable[[str], Any] = NORMALIZERS[normalizer]
+    benchmark.group = f"normalize-{size}"
+
+    benchmark(lambda: [normalize(text) for text in inputs])
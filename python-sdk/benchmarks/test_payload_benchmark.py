@@ -0,0 +1,43 @@
+from typing import Any, Dict, Optional
+
+import pytest
+
+from rebuff import Rebuff
+from stubs import StubApiServer
+
+PAYLOAD_MODES: Dict[str, Dict[str, Any]] = {
+    "full": {},
+    "compact": {"compact_payloads": True},
+    "compact-gzip": {"compact_payloads": True, "compression": "gzip"},
+    "compact-zstd": {"compact_payloads": True, "compression": "zstd"},
+}
+
+INPUT_SIZES = [1024, 64 * 1024, 256 * 1024]
+
+
+def make_document(size: int) -> str:
+    sentence = "The quarterly report covers revenue, churn and hiring plans. "
+    return (sentence * (size // len(sentence) + 1))[:size]
+
+
+@pytest.mark.parametrize("input_size", INPUT_SIZES)
+@pytest.mark.parametrize("mode", PAYLOAD_MODES)
+def test_detect_payload(
+    benchmark: Any, stub_api_server: StubApiServer, mode: str, input_size: int
+) -> None:
+    if mode == "compact-zstd":
+        pytest.importorskip("zstandard")
+
+    options: Dict[str, Any] = PAYLOAD_MODES[mode]
+    rb = Rebuff(api_token="12345", api_url=stub_api_server.url, **options)
+    document = make_document(input_size)
+
+    stub_api_server.body_sizes.clear()
+    result: Optional[Any] = benchmark(rb.detect_injection, document)
+
+    assert result is not None
+    benchmark.extra_info["input_bytes"] = input_size
+    benchmark.extra_info["request_bytes"] = stub_api_server.body_sizes[-1]
+    benchmark.extra_info["overhead_ratio"] = round(
+        stub_api_server.body_sizes[-1] / input_size, 3
+    )
@@ -0,0 +1,52 @@
+from typing import Any, Dict, List
+
+import pytest
+
+from rebuff import DetectionColumns, RebuffDetectionResponse
+
+BATCH_SIZE = 10000
+
+FIELDS: Dict[str, Any] = dict(
+    heuristic_score=0.12,
+    openai_score=0.0,
+    vector_score=0.4,
+    run_heuristic_check=True,
+    run_vector_check=True,
+    run_language_model_check=False,
+    max_heuristic_score=0.75,
+    max_model_score=0.9,
+    max_vector_score=0.9,
+    injection_detected=False,
+)
+
+
+def build_validated() -> List[RebuffDetectionResponse]:
+    return [RebuffDetectionResponse(**FIELDS) for _ in range(BATCH_SIZE)]
+
+
+def build_constructed() -> List[RebuffDetectionResponse]:
+    return [
+        RebuffDetectionResponse.model_construct(**FIELDS) for _ in range(BATCH_SIZE)
+    ]
+
+
+def build_columns() -> DetectionColumns:
+    columns = DetectionColumns.empty(BATCH_SIZE)
+    for i in range(BATCH_SIZE):
+        columns.heuristic_score[i] = FIELDS["heuristic_score"]
+        columns.vector_score[i] = FIELDS["vector_score"]
+        columns.run_heuristic_check[i] = True
+        columns.run_vector_check[i] = True
+    return columns
+
+
+@pytest.mark.parametrize(
+    "build",
+    [build_validated, build_constructed, build_columns],
+    ids=["validated", "constructed", "columns"],
+)
+def test_build_batch_results(benchmark: Any, build: Any) -> None:
+    results = benchmark(build)
+
+    assert len(results) == BATCH_SIZE
+    benchmark.extra_info["results"] = BATCH_SIZE
@@ -0,0 +1,63 @@
+from typing import Any, List, Tuple
+
+import pytest
+
+from rebuff.quantized_vector_store import QuantizedVectorStore
+
+numpy = pytest.importorskip("numpy")
+
+# The size of text-embedding-ada-002 vectors
+DIMENSIONS = 1536
+ENTRIES = 20000
+QUERIES = 20
+K = 20
+
+
+@pytest.fixture(scope="module")
+def store_and_queries(
+    tmp_path_factory: pytest.TempPathFactory,
+) -> Tuple[QuantizedVectorStore, Any]:
+    # Attack embeddings cluster around a few hundred phrasings, and queries are close to one of them
+    rng = numpy.random.default_rng(0)
+    centers = rng.normal(size=(ENTRIES // 50, DIMENSIONS))
+    vectors = centers[rng.integers(len(centers), size=ENTRIES)]
+    vectors += 0.3 * rng.normal(size=vectors.shape)
+    queries = vectors[rng.integers(ENTRIES, size=QUERIES)]
+    queries += 0.2 * rng.normal(size=queries.shape)
+
+    store = QuantizedVectorStore(
+        str(tmp_path_factory.mktemp("vector_store")), dimensions=DIMENSIONS
+    )
+    store.add_vectors(vectors, [""] * ENTRIES)
+    return store, queries
+
+
+def search_all(search: Any, queries: Any) -> List[List[Tuple[int, float]]]:
+    return [search(query, K) for query in queries]
+
+
+@pytest.mark.parametrize("method", ["exact", "quantized"])
+def test_vector_search(
+    benchmark: Any, store_and_queries: Tuple[QuantizedVectorStore, Any], method: str
+) -> None:
+    store, queries = store_and_queries
+    search = store.search_exact if method == "exact" else store.search_by_vector
+
+    results = benchmark.pedantic(
+        search_all, args=(search, queries), rounds=5, iterations=1
+    )
+
+    exact_results = search_all(store.search_exact, queries)
+    recall = sum(
+        len({i for i, _ in found} & {i for i, _ in expected}) / K
+        for found, expected in zip(results, exact_results)
+    ) / len(queries)
+    benchmark.extra_info["recall_at_k"] = round(recall, 4)
+    if benchmark.stats is not None:
+        benchmark.extra_info["queries_per_second"] = round(
+            len(queries) / benchmark.stats.stats.mean, 2
+        )
+    benchmark.extra_info["scanned_bytes"] = (
+        store.memory_bytes if method == "quantized" else ENTRIES * DIMENSIONS * 4
+    )
+    assert recall >= 0.95
@@ -2,9 +2,25 @@ from rebuff._version import __version__
 
 from .rebuff import (
     ApiFailureResponse,
+    DetectApiBatchRequest,
+    DetectApiBatchSuccessResponse,
     DetectApiRequest,
     DetectApiSuccessResponse,
     Rebuff,
 )
 
+from .detect_pi_classifier import PromptInjectionClassifier, train_classifier
+from .detect_pi_heuristics import ConversationScanner
+from .prepared_input import PreparedInput
+from .quantized_vector_store import QuantizedVectorStore
+from .instrumentation import InstrumentationHook, OpenTelemetryHook, PrometheusHook
+from .sampling import (
+    FixedRateSampling,
+    SamplingPolicy,
+    ScoreThresholdSampling,
+    ShadowRecorder,
+    ShadowResult,
+    TenantRateSampling,
+)
 from .sdk import RebuffSdk, RebuffDetectionResponse
+from .columnar import DetectionColumns
@@ -0,0 +1,50 @@
+from functools import lru_cache
+from typing import Any, List
+
+
+@lru_cache(maxsize=None)
+def get_encoding(encoding_name: str) -> Any:
+    # Imported on first use, tiktoken is slow to import and loads its encoding from disk or the network
+    import tiktoken
+
+    return tiktoken.get_encoding(encoding_name)
+
+
+def chunk_text_by_tokens(
+    text: str,
+    max_tokens: int = 512,
+    overlap_tokens: int = 64,
+    encoding_name: str = "cl100k_base",
+) -> List[str]:
+    """
+    Splits text into overlapping chunks of at most max_tokens tokens, so that an injection spanning a chunk boundary
+    still appears whole in one of the chunks as long as it is shorter than the overlap.
+
+    Args:
+        text (str): The text to split.
+        max_tokens (int, optional): The maximum number of tokens per chunk. Defaults to 512.
+        overlap_tokens (int, optional): The number of tokens shared by consecutive chunks. Defaults to 64.
+        encoding_name (str, optional): The tiktoken encoding used to count tokens. Defaults to "cl100k_base", the
+            encoding of the OpenAI embedding and chat models.
+
+    Returns:
+        List[str]: The chunks in document order. Text that fits in one chunk is returned as is.
+    """
+    if max_tokens < 1:
+        raise ValueError("max_tokens must be at least 1")
+    if not 0 <= overlap_tokens < max_tokens:
+        raise ValueError("overlap_tokens must be at least 0 and less than max_tokens")
+
+    encoding = get_encoding(encoding_name)
+    tokens = encoding.encode(text, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return [text]
+
+    chunks = []
+    step = max_tokens - overlap_tokens
+    for start in range(0, len(tokens) - overlap_tokens, step):
+        # A token can end part way through a multi-byte character, drop the partial bytes at the edges
+        chunk_bytes = encoding.decode_bytes(tokens[start : start + max_tokens])
+        chunks.append(chunk_bytes.decode("utf-8", errors="ignore"))
+
+    return chunks
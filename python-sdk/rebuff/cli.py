@@ -0,0 +1,591 @@
+import argparse
+import csv
+import json
+import mmap
+import os
+import sys
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import IO, Any, Dict, Iterator, List, Optional, Sequence, Tuple, cast
+
+from pydantic import BaseModel
+
+from .detect_pi_classifier import PromptInjectionClassifier
+from .detect_pi_heuristics import detect_prompt_injection_using_heuristic_on_input
+from .heuristic_index import build_compiled_index
+from .sdk import RebuffSdk
+
+INPUT_FORMATS = ("jsonl", "csv")
+OUTPUT_FORMATS = ("jsonl", "parquet")
+
+
+class ScanRecord(BaseModel):
+    # Position of the record in the input, counting from 0
+    record: int
+    id: Optional[str]
+    text: str
+    # Byte offset just past the record, where a resumed scan continues reading
+    end_offset: int
+
+
+class ScanCheckpoint(BaseModel):
+    input_path: str
+    records: int
+    input_offset: int
+    output_size: int
+    output_parts: int
+
+
+class ScanSummary(BaseModel):
+    records: int
+    detected: int
+    skipped: int
+    seconds: float
+    records_per_second: float
+
+
+def infer_format(path: str, formats: Sequence[str]) -> str:
+    extension = os.path.splitext(path)[1].lstrip(".").lower()
+    if extension == "ndjson":
+        extension = "jsonl"
+    if extension not in formats:
+        raise ValueError(
+            f"Cannot tell the format of {path}, pass one of: {', '.join(formats)}"
+        )
+    return extension
+
+
+def iter_mapped_lines(mapped: mmap.mmap) -> Iterator[Tuple[bytes, int]]:
+    """
+    Yields the lines of a memory-mapped file with the byte offset just past each one.
+    """
+    while True:
+        line = mapped.readline()
+        if not line:
+            return
+        yield line, mapped.tell()
+
+
+def parse_json_record(line: bytes) -> Any:
+    """
+    Parses a JSONL line, returning None for invalid JSON so that iter_records reports it as a bad record.
+    """
+    try:
+        return json.loads(line)
+    except ValueError:
+        return None
+
+
+def iter_records(
+    path: str,
+    input_format: str,
+    text_field: str,
+    id_field: Optional[str] = None,
+    start_record: int = 0,
+    start_offset: int = 0,
+) -> Iterator[ScanRecord]:
+    """
+    Streams the records of a JSONL or CSV file. The file is memory-mapped, so only the pages being parsed are held in
+    memory, and a scan can start at the byte offset where a previous one stopped.
+
+    Args:
+        path (str): The input file.
+        input_format (str): "jsonl" (one JSON object per line) or "csv" (with a header row).
+        text_field (str): The field holding the text to scan.
+        id_field (Optional[str], optional): A field copied to the results to identify the record. Defaults to None.
+        start_record (int, optional): The position of the first record read. Defaults to 0.
+        start_offset (int, optional): The byte offset to start reading at, the start of a record. Defaults to 0.
+
+    Returns:
+        Iterator[ScanRecord]: The records in file order.
+    """
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            if input_format == "csv":
+                # The header is always read from the start of the file, then reading resumes at the offset
+                header = next(csv.reader([mapped.readline().decode("utf-8-sig")]))
+                mapped.seek(max(start_offset, mapped.tell()))
+                lines = iter_mapped_lines(mapped)
+                # The csv reader pulls one more line for quoted values containing newlines, so the offset of the last
+                # line pulled is the end of the row
+                offsets: List[int] = [mapped.tell()]
+
+                def decoded_lines() -> Iterator[str]:
+                    for line, end_offset in lines:
+                        offsets[0] = end_offset
+                        yield line.decode("utf-8")
+
+                rows = (
+                    (dict(zip(header, row)), offsets[0])
+                    for row in csv.reader(decoded_lines())
+                    if row
+                )
+            else:
+                mapped.seek(start_offset)
+                rows = (
+                    (parse_json_record(line), end_offset)
+                    for line, end_offset in iter_mapped_lines(mapped)
+                    if line.strip()
+                )
+
+            for record_number, (row, end_offset) in enumerate(rows, start_record):
+                if not isinstance(row, dict):
+                    raise ValueError(
+                        f"Record {record_number} of {path} is not a JSON object"
+                    )
+                if text_field not in row:
+                    raise ValueError(
+                        f"Record {record_number} of {path} has no {text_field!r} field"
+                    )
+                record_id = row.get(id_field) if id_field else None
+                yield ScanRecord(
+                    record=record_number,
+                    id=None if record_id is None else str(record_id),
+                    text=str(row[text_field] or ""),
+                    end_offset=end_offset,
+                )
+
+
+class ResultWriter:
+    """
+    Writes scan results incrementally, as JSON lines appended to a file or as one Parquet file per checkpoint in a
+    directory. Everything written is complete on disk once write_batch returns.
+    """
+
+    def __init__(
+        self, path: str, output_format: str, size: int = 0, parts: int = 0
+    ) -> None:
+        """
+        Args:
+            path (str): The JSONL file or Parquet directory.
+            output_format (str): "jsonl" or "parquet".
+            size (int, optional): The size of the JSONL file at the last checkpoint, anything after it is discarded.
+                Defaults to 0.
+            parts (int, optional): The number of Parquet files at the last checkpoint, later ones are discarded.
+                Defaults to 0.
+        """
+        self.path = path
+        self.output_format = output_format
+        self.parts = parts
+        self._file: Optional[IO[bytes]] = None
+
+        if output_format == "parquet":
+            try:
+                import pyarrow  # noqa: F401
+            except ImportError:
+                raise ImportError(
+                    "Parquet output requires the pyarrow package: pip install pyarrow"
+                )
+            os.makedirs(path, exist_ok=True)
+            for name in os.listdir(path):
+                if name.startswith("part-") and self._part_number(name) >= parts:
+                    os.remove(os.path.join(path, name))
+        else:
+            self._file = open(path, "r+b" if size else "wb")
+            self._file.truncate(size)
+            self._file.seek(size)
+
+    @staticmethod
+    def _part_number(name: str) -> int:
+        try:
+            return int(name[len("part-") :].split(".")[0])
+        except ValueError:
+            return -1
+
+    @property
+    def size(self) -> int:
+        return self._file.tell() if self._file else 0
+
+    def write_batch(self, results: List[Dict[str, Any]]) -> None:
+        if not results:
+            return
+        if self._file is None:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+            table = pa.Table.from_pylist(results)
+            pq.write_table(
+                table, os.path.join(self.path, f"part-{self.parts:05d}.parquet")
+            )
+            self.parts += 1
+        else:
+            self._file.write(
+                b"".join(json.dumps(result).encode() + b"\n" for result in results)
+            )
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+
+
+def load_checkpoint(path: str) -> Optional[ScanCheckpoint]:
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return ScanCheckpoint.model_validate(json.load(f))
+
+
+def save_checkpoint(path: str, checkpoint: ScanCheckpoint) -> None:
+    # Replaced atomically, so an interrupted scan leaves either the old or the new checkpoint
+    temporary_path = path + ".tmp"
+    with open(temporary_path, "w") as f:
+        json.dump(checkpoint.model_dump(), f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary_path, path)
+
+
+def scan(
+    input_path: str,
+    output_path: str,
+    text_field: str = "text",
+    id_field: Optional[str] = None,
+    input_format: Optional[str] = None,
+    output_format: Optional[str] = None,
+    sdk: Optional[RebuffSdk] = None,
+    check_heuristic: bool = True,
+    check_vector: bool = True,
+    check_llm: bool = True,
+    max_heuristic_score: float = 0.75,
+    max_vector_score: float = 0.90,
+    max_model_score: float = 0.90,
+    classifier: Optional[PromptInjectionClassifier] = None,
+    max_classifier_score: float = 0.90,
+    workers: Optional[int] = None,
+    remote_concurrency: int = 8,
+    batch_size: int = 1000,
+    checkpoint_path: Optional[str] = None,
+    resume: bool = False,
+    max_records: Optional[int] = None,
+) -> ScanSummary:
+    """
+    Scans every record of a JSONL or CSV file for prompt injection and writes one result per record.
+
+    The heuristic runs in a pool of worker processes. The vector and language model checks go through the SDK with at
+    most remote_concurrency requests in flight. Records are handled in batches of batch_size; after each batch the
+    results are flushed and the checkpoint is updated, so an interrupted scan resumes after the last complete batch.
+
+    Args:
+        input_path (str): The JSONL or CSV file to scan.
+        output_path (str): The JSONL file, or directory of Parquet files, to write results to.
+        text_field (str, optional): The field holding the text to scan. Defaults to "text".
+        id_field (Optional[str], optional): A field copied to the results to identify the record. Defaults to None.
+        input_format (Optional[str], optional): "jsonl" or "csv". Defaults to None, which uses the file extension.
+        output_format (Optional[str], optional): "jsonl" or "parquet". Defaults to None, which uses the extension.
+        sdk (Optional[RebuffSdk], optional): The SDK used for the vector and language model checks. Required if
+            either is enabled.
+        check_heuristic (bool, optional): Whether to run the heuristic check. Defaults to True.
+        check_vector (bool, optional): Whether to run the vector check. Defaults to True.
+        check_llm (bool, optional): Whether to run the language model check. Defaults to True.
+        max_heuristic_score (float, optional): The maximum heuristic score allowed. Defaults to 0.75.
+        max_vector_score (float, optional): The maximum vector score allowed. Defaults to 0.90.
+        max_model_score (float, optional): The maximum model (LLM) score allowed. Defaults to 0.90.
+        classifier (Optional[PromptInjectionClassifier], optional): A local classifier to also score every record
+            with, adding a classifier_score column. Defaults to None.
+        max_classifier_score (float, optional): The maximum classifier score allowed. Defaults to 0.90.
+        workers (Optional[int], optional): The number of heuristic worker processes. Defaults to the CPU count.
+        remote_concurrency (int, optional): The maximum number of records in the vector and language model checks
+            at once. Defaults to 8.
+        batch_size (int, optional): The number of records between checkpoints. Defaults to 1000.
+        checkpoint_path (Optional[str], optional): The checkpoint file. Defaults to output_path + ".checkpoint".
+        resume (bool, optional): Whether to continue from the checkpoint instead of starting over. Defaults to False.
+        max_records (Optional[int], optional): Stop after this many records in this run. Defaults to None.
+
+    Returns:
+        ScanSummary: The number of records scanned and detected in this run, and the throughput.
+    """
+    if batch_size < 1:
+        raise ValueError("batch_size must be at least 1")
+    if remote_concurrency < 1:
+        raise ValueError("remote_concurrency must be at least 1")
+    if (check_vector or check_llm) and sdk is None:
+        raise ValueError("The vector and language model checks need a RebuffSdk")
+
+    input_format = input_format or infer_format(input_path, INPUT_FORMATS)
+    if output_format is None:
+        output_format = "parquet" if output_path.endswith(".parquet") else "jsonl"
+    checkpoint_path = checkpoint_path or output_path + ".checkpoint"
+
+    checkpoint = load_checkpoint(checkpoint_path) if resume else None
+    if checkpoint is None:
+        checkpoint = ScanCheckpoint(
+            input_path=os.path.abspath(input_path),
+            records=0,
+            input_offset=0,
+            output_size=0,
+            output_parts=0,
+        )
+    elif checkpoint.input_path != os.path.abspath(input_path):
+        raise ValueError(
+            f"{checkpoint_path} is a checkpoint for {checkpoint.input_path}, not {input_path}"
+        )
+
+    records = iter_records(
+        input_path,
+        input_format,
+        text_field,
+        id_field,
+        start_record=checkpoint.records,
+        start_offset=checkpoint.input_offset,
+    )
+    writer = ResultWriter(
+        output_path, output_format, checkpoint.output_size, checkpoint.output_parts
+    )
+
+    heuristic_pool: Optional[Executor] = (
+        ProcessPoolExecutor(max_workers=workers) if check_heuristic else None
+    )
+    remote_pool: Optional[Executor] = (
+        ThreadPoolExecutor(max_workers=remote_concurrency)
+        if check_vector or check_llm
+        else None
+    )
+
+    def remote_scores(text: str) -> Tuple[float, float]:
+        response = cast(RebuffSdk, sdk).detect_injection(
+            text,
+            max_vector_score=max_vector_score,
+            check_heuristic=False,
+            check_vector=check_vector,
+            check_llm=check_llm,
+        )
+        return response.vector_score, response.openai_score
+
+    scanned = 0
+    detected = 0
+    start = time.perf_counter()
+    try:
+        while max_records is None or scanned < max_records:
+            limit = batch_size
+            if max_records is not None:
+                limit = min(limit, max_records - scanned)
+            batch = [record for _, record in zip(range(limit), records)]
+            if not batch:
+                break
+            texts = [record.text for record in batch]
+
+            # Both pools work on the batch at the same time, heuristic results are collected while remote checks run
+            remote_results = (
+                remote_pool.map(remote_scores, texts)
+                if remote_pool
+                else iter([(0.0, 0.0)] * len(batch))
+            )
+            heuristic_scores = (
+                heuristic_pool.map(
+                    detect_prompt_injection_using_heuristic_on_input,
+                    texts,
+                    chunksize=max(
+                        1, len(texts) // (4 * (workers or os.cpu_count() or 1))
+                    ),
+                )
+                if heuristic_pool
+                else iter([0.0] * len(batch))
+            )
+            # The classifier is fast enough to score the batch in this process while the pools work
+            classifier_scores = (
+                classifier.score_batch(texts) if classifier else [0.0] * len(batch)
+            )
+
+            results = []
+            scores = zip(list(heuristic_scores), classifier_scores, remote_results)
+            for record, (heuristic_score, classifier_score, remote) in zip(
+                batch, scores
+            ):
+                vector_score, model_score = remote
+                injection_detected = (
+                    heuristic_score > max_heuristic_score
+                    or vector_score > max_vector_score
+                    or model_score > max_model_score
+                    or classifier_score > max_classifier_score
+                )
+                detected += injection_detected
+                result = {
+                    "record": record.record,
+                    "id": record.id,
+                    "heuristic_score": heuristic_score,
+                    "vector_score": vector_score,
+                    "openai_score": model_score,
+                    "injection_detected": injection_detected,
+                }
+                if classifier:
+                    result["classifier_score"] = classifier_score
+                results.append(result)
+
+            writer.write_batch(results)
+            scanned += len(batch)
+            checkpoint.records = batch[-1].record + 1
+            checkpoint.input_offset = batch[-1].end_offset
+            checkpoint.output_size = writer.size
+            checkpoint.output_parts = writer.parts
+            save_checkpoint(checkpoint_path, checkpoint)
+    finally:
+        writer.close()
+        for pool in (heuristic_pool, remote_pool):
+            if pool is not None:
+                pool.shutdown()
+
+    seconds = time.perf_counter() - start
+    return ScanSummary(
+        records=scanned,
+        detected=detected,
+        skipped=checkpoint.records - scanned,
+        seconds=seconds,
+        records_per_second=scanned / seconds if seconds else 0.0,
+    )
+
+
+def sdk_from_environment(openai_model: str) -> RebuffSdk:
+    names = [
+        "OPENAI_API_KEY",
+        "PINECONE_API_KEY",
+        "PINECONE_ENVIRONMENT",
+        "PINECONE_INDEX_NAME",
+    ]
+    missing = [name for name in names if not os.environ.get(name)]
+    if missing:
+        raise SystemExit(
+            f"The vector and language model checks need {', '.join(missing)} to be set, "
+            "or pass --no-vector --no-llm for a heuristic-only scan"
+        )
+    openai_apikey, pinecone_apikey, pinecone_environment, pinecone_index = (
+        os.environ[name] for name in names
+    )
+    return RebuffSdk(
+        openai_apikey,
+        pinecone_apikey,
+        pinecone_environment,
+        pinecone_index,
+        openai_model=openai_model,
+    )
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="rebuff", description="Rebuff prompt injection detection"
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    scan_parser = commands.add_parser(
+        "scan",
+        help="Scan a JSONL or CSV file of prompts",
+        description="Scans every record of a JSONL or CSV file and writes one result per record. The vector and "
+        "language model checks read OPENAI_API_KEY, PINECONE_API_KEY, PINECONE_ENVIRONMENT and PINECONE_INDEX_NAME "
+        "from the environment.",
+    )
+    scan_parser.add_argument("input", help="The JSONL or CSV file to scan")
+    scan_parser.add_argument(
+        "-o",
+        "--output",
+        required=True,
+        help="The JSONL file, or directory of Parquet files, to write results to",
+    )
+    scan_parser.add_argument("--input-format", choices=INPUT_FORMATS)
+    scan_parser.add_argument("--output-format", choices=OUTPUT_FORMATS)
+    scan_parser.add_argument(
+        "--text-field", default="text", help="The field holding the text to scan"
+    )
+    scan_parser.add_argument(
+        "--id-field", help="A field copied to the results to identify the record"
+    )
+    scan_parser.add_argument("--no-heuristic", action="store_true")
+    scan_parser.add_argument("--no-vector", action="store_true")
+    scan_parser.add_argument("--no-llm", action="store_true")
+    scan_parser.add_argument("--max-heuristic-score", type=float, default=0.75)
+    scan_parser.add_argument("--max-vector-score", type=float, default=0.90)
+    scan_parser.add_argument("--max-model-score", type=float, default=0.90)
+    scan_parser.add_argument("--openai-model", default="gpt-3.5-turbo")
+    scan_parser.add_argument(
+        "--classifier", help="A local classifier file to also score records with"
+    )
+    scan_parser.add_argument("--max-classifier-score", type=float, default=0.90)
+    scan_parser.add_argument(
+        "--workers",
+        type=int,
+        help="Heuristic worker processes, the CPU count by default",
+    )
+    scan_parser.add_argument(
+        "--remote-concurrency",
+        type=int,
+        default=8,
+        help="Records in the vector and language model checks at once",
+    )
+    scan_parser.add_argument(
+        "--batch-size", type=int, default=1000, help="Records between checkpoints"
+    )
+    scan_parser.add_argument(
+        "--checkpoint",
+        help="The checkpoint file, the output path + .checkpoint by default",
+    )
+    scan_parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Continue from the checkpoint instead of starting over",
+    )
+    scan_parser.add_argument(
+        "--max-records", type=int, help="Stop after this many records"
+    )
+
+    index_parser = commands.add_parser(
+        "build-index",
+        help="Compile the heuristic keyword index",
+        description="Compiles the heuristic keyword index to a file. Point REBUFF_HEURISTIC_INDEX at the file so "
+        "that every process on the host memory-maps the same copy; it is rebuilt automatically when the keywords "
+        "change.",
+    )
+    index_parser.add_argument("path", help="The index file to write")
+    return parser
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+
+    if args.command == "build-index":
+        build_compiled_index(args.path)
+        print(f"Wrote the heuristic index to {args.path}", file=sys.stderr)
+        return 0
+
+    check_vector = not args.no_vector
+    check_llm = not args.no_llm
+    sdk = sdk_from_environment(args.openai_model) if check_vector or check_llm else None
+
+    summary = scan(
+        args.input,
+        args.output,
+        text_field=args.text_field,
+        id_field=args.id_field,
+        input_format=args.input_format,
+        output_format=args.output_format,
+        sdk=sdk,
+        check_heuristic=not args.no_heuristic,
+        check_vector=check_vector,
+        check_llm=check_llm,
+        max_heuristic_score=args.max_heuristic_score,
+        max_vector_score=args.max_vector_score,
+        max_model_score=args.max_model_score,
+        classifier=(
+            PromptInjectionClassifier.load(args.classifier) if args.classifier else None
+        ),
+        max_classifier_score=args.max_classifier_score,
+        workers=args.workers,
+        remote_concurrency=args.remote_concurrency,
+        batch_size=args.batch_size,
+        checkpoint_path=args.checkpoint,
+        resume=args.resume,
+        max_records=args.max_records,
+    )
+
+    print(
+        f"Scanned {summary.records} records in {summary.seconds:.1f}s "
+        f"({summary.records_per_second:.1f} records/s), "
+        f"{summary.detected} detected, {summary.skipped} already scanned",
+        file=sys.stderr,
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
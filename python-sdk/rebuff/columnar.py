@@ -0,0 +1,170 @@
+import math
+from typing import TYPE_CHECKING, Any, Iterable, Iterator, List, Mapping
+
+from .sdk import RebuffDetectionResponse
+
+if TYPE_CHECKING:
+    import numpy
+    import pandas
+    from numpy.typing import NDArray
+
+    from .rebuff import DetectApiSuccessResponse
+
+SCORE_COLUMNS = (
+    "heuristic_score",
+    "openai_score",
+    "vector_score",
+    "classifier_score",
+    "max_heuristic_score",
+    "max_model_score",
+    "max_vector_score",
+    # NaN where the classifier check was not requested
+    "max_classifier_score",
+)
+FLAG_COLUMNS = (
+    "run_heuristic_check",
+    "run_vector_check",
+    "run_language_model_check",
+    "run_classifier_check",
+    "injection_detected",
+)
+COLUMNS = SCORE_COLUMNS + FLAG_COLUMNS
+
+
+def import_numpy() -> Any:
+    try:
+        import numpy
+    except ImportError:
+        raise ImportError(
+            "DetectionColumns requires the numpy package: pip install rebuff[numpy]"
+        )
+    return numpy
+
+
+class DetectionColumns:
+    """
+    Detection results for a batch of inputs, held as one NumPy array per field of RebuffDetectionResponse: float64
+    for scores and thresholds, bool for the check and verdict flags. Row i is the result for input i. Per-row response
+    objects and DataFrames are only built on request.
+    """
+
+    heuristic_score: "NDArray[numpy.float64]"
+    openai_score: "NDArray[numpy.float64]"
+    vector_score: "NDArray[numpy.float64]"
+    classifier_score: "NDArray[numpy.float64]"
+    max_heuristic_score: "NDArray[numpy.float64]"
+    max_model_score: "NDArray[numpy.float64]"
+    max_vector_score: "NDArray[numpy.float64]"
+    max_classifier_score: "NDArray[numpy.float64]"
+    run_heuristic_check: "NDArray[numpy.bool_]"
+    run_vector_check: "NDArray[numpy.bool_]"
+    run_language_model_check: "NDArray[numpy.bool_]"
+    run_classifier_check: "NDArray[numpy.bool_]"
+    injection_detected: "NDArray[numpy.bool_]"
+
+    def __init__(self, columns: Mapping[str, Any]) -> None:
+        """
+        Args:
+            columns (Mapping[str, Any]): An array-like of equal length for each name in COLUMNS.
+        """
+        numpy = import_numpy()
+        for name in SCORE_COLUMNS:
+            setattr(self, name, numpy.asarray(columns[name], dtype=numpy.float64))
+        for name in FLAG_COLUMNS:
+            setattr(self, name, numpy.asarray(columns[name], dtype=numpy.bool_))
+        if len({len(getattr(self, name)) for name in COLUMNS}) > 1:
+            raise ValueError("All columns must have the same length")
+
+    @classmethod
+    def empty(cls, length: int) -> "DetectionColumns":
+        """
+        Returns columns of the given length filled with zeros and False, to be filled in place.
+        """
+        numpy = import_numpy()
+        return cls(
+            {
+                **{name: numpy.zeros(length) for name in SCORE_COLUMNS},
+                **{name: numpy.zeros(length, dtype=bool) for name in FLAG_COLUMNS},
+            }
+        )
+
+    @classmethod
+    def from_responses(
+        cls, responses: Iterable[RebuffDetectionResponse]
+    ) -> "DetectionColumns":
+        """
+        Collects the fields of many responses into columns.
+        """
+        responses = list(responses)
+        columns = {
+            name: [getattr(response, name) for response in responses]
+            for name in COLUMNS
+        }
+        columns["max_classifier_score"] = [
+            math.nan if score is None else score
+            for score in columns["max_classifier_score"]
+        ]
+        return cls(columns)
+
+    @classmethod
+    def from_api_responses(
+        cls, responses: Iterable["DetectApiSuccessResponse"]
+    ) -> "DetectionColumns":
+        """
+        Collects the results of the Rebuff detect API into columns. The API has no classifier check, so the classifier
+        columns hold 0, False and NaN.
+        """
+        responses = list(responses)
+        not_run = [False] * len(responses)
+        return cls(
+            {
+                "heuristic_score": [r.heuristicScore for r in responses],
+                "openai_score": [r.modelScore for r in responses],
+                "vector_score": [r.vectorScore["topScore"] for r in responses],
+                "classifier_score": [0.0] * len(responses),
+                "max_heuristic_score": [r.maxHeuristicScore for r in responses],
+                "max_model_score": [r.maxModelScore for r in responses],
+                "max_vector_score": [r.maxVectorScore for r in responses],
+                "max_classifier_score": [math.nan] * len(responses),
+                "run_heuristic_check": [r.runHeuristicCheck for r in responses],
+                "run_vector_check": [r.runVectorCheck for r in responses],
+                "run_language_model_check": [
+                    r.runLanguageModelCheck for r in responses
+                ],
+                "run_classifier_check": not_run,
+                "injection_detected": [r.injectionDetected for r in responses],
+            }
+        )
+
+    def __len__(self) -> int:
+        return len(self.injection_detected)
+
+    def row(self, index: int) -> RebuffDetectionResponse:
+        """
+        Builds the response for one input.
+        """
+        fields = {name: getattr(self, name)[index].item() for name in COLUMNS}
+        if math.isnan(fields["max_classifier_score"]):
+            fields["max_classifier_score"] = None
+        return RebuffDetectionResponse(**fields)
+
+    def __iter__(self) -> Iterator[RebuffDetectionResponse]:
+        return (self.row(index) for index in range(len(self)))
+
+    def to_list(self) -> List[RebuffDetectionResponse]:
+        """
+        Returns the response for every input, in order.
+        """
+        return list(self)
+
+    def to_pandas(self) -> "pandas.DataFrame":
+        """
+        Returns a DataFrame with a column per field and a row per input. Requires the pandas package.
+        """
+        try:
+            import pandas
+        except ImportError:
+            raise ImportError(
+                "DetectionColumns.to_pandas requires the pandas package: pip install rebuff[pandas]"
+            )
+        return pandas.DataFrame({name: getattr(self, name) for name in COLUMNS})
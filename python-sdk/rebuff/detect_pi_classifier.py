@@ -0,0 +1,222 @@
+import json
+import math
+import random
+import sys
+import zlib
+from array import array
+from typing import Dict, Iterable, List, Sequence, Tuple, Union
+
+from .prepared_input import PreparedInput, prepare_input
+
+# Version 2 hashes the n-grams of the PreparedInput normalization
+CLASSIFIER_MAGIC = b"REBUFF-PI-CLASSIFIER 2\n"
+
+
+def sigmoid(z: float) -> float:
+    if z >= 0:
+        return 1 / (1 + math.exp(-z))
+    exp_z = math.exp(z)
+    return exp_z / (1 + exp_z)
+
+
+class PromptInjectionClassifier:
+    """
+    A logistic regression over hashed word and character n-grams of the input. Scoring is a few hundred dictionary
+    and array lookups, so it runs on the CPU in well under a millisecond for typical inputs.
+    """
+
+    def __init__(
+        self,
+        weights: "array[float]",
+        bias: float = 0.0,
+        word_ngrams: Tuple[int, int] = (1, 2),
+        char_ngrams: Tuple[int, int] = (3, 4),
+    ) -> None:
+        """
+        Args:
+            weights (array[float]): The weight of each hashed feature, the length must be a power of two.
+            bias (float, optional): The intercept. Defaults to 0.0.
+            word_ngrams (Tuple[int, int], optional): The smallest and largest word n-grams used. Defaults to (1, 2).
+            char_ngrams (Tuple[int, int], optional): The smallest and largest character n-grams used. Defaults to
+                (3, 4).
+        """
+        if len(weights) & (len(weights) - 1) or not weights:
+            raise ValueError("The number of weights must be a power of two")
+        self.weights = weights
+        self.bias = bias
+        self.word_ngrams = word_ngrams
+        self.char_ngrams = char_ngrams
+        self._mask = len(weights) - 1
+
+    @classmethod
+    def empty(
+        cls,
+        hash_bits: int = 16,
+        word_ngrams: Tuple[int, int] = (1, 2),
+        char_ngrams: Tuple[int, int] = (3, 4),
+    ) -> "PromptInjectionClassifier":
+        """
+        Returns an untrained classifier with 2 ** hash_bits zero weights.
+        """
+        return cls(array("f", bytes(4 << hash_bits)), 0.0, word_ngrams, char_ngrams)
+
+    def features(self, text: Union[str, PreparedInput]) -> Tuple[List[int], float]:
+        """
+        Hashes the n-grams of the normalized input.
+
+        Args:
+            text (Union[str, PreparedInput]): The input.
+
+        Returns:
+            Tuple[List[int], float]: The distinct feature indices, and the value of each, so that the feature vector
+                has unit length.
+        """
+        prepared = prepare_input(text)
+        words = prepared.tokens
+        keys = []
+        for n in range(self.word_ngrams[0], self.word_ngrams[1] + 1):
+            for start in range(len(words) - n + 1):
+                keys.append("w " + " ".join(words[start : start + n]))
+        padded = f" {prepared.normalized} "
+        for n in range(self.char_ngrams[0], self.char_ngrams[1] + 1):
+            for start in range(len(padded) - n + 1):
+                keys.append("c " + padded[start : start + n])
+
+        mask = self._mask
+        indices = list({zlib.crc32(key.encode()) & mask for key in keys})
+        return indices, 1 / math.sqrt(len(indices)) if indices else 0.0
+
+    def score(self, text: Union[str, PreparedInput]) -> float:
+        """
+        Scores the input.
+
+        Args:
+            text (Union[str, PreparedInput]): The input to be checked for prompt injection.
+
+        Returns:
+            float: The probability that the input is a prompt injection, between 0 and 1.
+        """
+        indices, value = self.features(text)
+        weights = self.weights
+        return sigmoid(self.bias + value * sum([weights[i] for i in indices]))
+
+    def score_batch(self, texts: Iterable[Union[str, PreparedInput]]) -> List[float]:
+        """
+        Scores many inputs.
+
+        Args:
+            texts (Iterable[Union[str, PreparedInput]]): The inputs to be checked for prompt injection.
+
+        Returns:
+            List[float]: The score of each input, in order.
+        """
+        return [self.score(text) for text in texts]
+
+    def save(self, path: str) -> None:
+        """
+        Writes the classifier to a file: a header line, a JSON line with the settings, then the weights as
+        little-endian 32-bit floats.
+        """
+        weights = array("f", self.weights)
+        if sys.byteorder == "big":
+            weights.byteswap()
+        settings = {
+            "hash_bits": len(weights).bit_length() - 1,
+            "bias": self.bias,
+            "word_ngrams": list(self.word_ngrams),
+            "char_ngrams": list(self.char_ngrams),
+        }
+        with open(path, "wb") as f:
+            f.write(CLASSIFIER_MAGIC)
+            f.write(json.dumps(settings).encode() + b"\n")
+            weights.tofile(f)
+
+    @classmethod
+    def load(cls, path: str) -> "PromptInjectionClassifier":
+        """
+        Reads a classifier written by save.
+        """
+        with open(path, "rb") as f:
+            if f.readline() != CLASSIFIER_MAGIC:
+                raise ValueError(
+                    f"{path} is not a version 2 Rebuff classifier file, train it again"
+                )
+            settings = json.loads(f.readline())
+            weights = array("f")
+            weights.fromfile(f, 1 << settings["hash_bits"])
+        if sys.byteorder == "big":
+            weights.byteswap()
+        return cls(
+            weights,
+            settings["bias"],
+            tuple(settings["word_ngrams"]),
+            tuple(settings["char_ngrams"]),
+        )
+
+
+def train_classifier(
+    texts: Sequence[str],
+    labels: Sequence[bool],
+    epochs: int = 10,
+    learning_rate: float = 0.5,
+    l2: float = 1e-6,
+    hash_bits: int = 16,
+    seed: int = 0,
+) -> PromptInjectionClassifier:
+    """
+    Trains a classifier with stochastic gradient descent on the log loss.
+
+    Args:
+        texts (Sequence[str]): The training inputs, for example inputs logged with log_leakage and benign traffic.
+        labels (Sequence[bool]): Whether each input is a prompt injection.
+        epochs (int, optional): The number of passes over the inputs. Defaults to 10.
+        learning_rate (float, optional): The initial step size, decayed every epoch. Defaults to 0.5.
+        l2 (float, optional): The L2 regularization strength. Defaults to 1e-6.
+        hash_bits (int, optional): The classifier has 2 ** hash_bits weights. Defaults to 16.
+        seed (int, optional): Seeds the order the inputs are visited in. Defaults to 0.
+
+    Returns:
+        PromptInjectionClassifier: The trained classifier.
+    """
+    if len(texts) != len(labels):
+        raise ValueError("texts and labels must have the same length")
+
+    classifier = PromptInjectionClassifier.empty(hash_bits)
+    weights = classifier.weights
+    examples = [
+        classifier.features(text) + (float(label),)
+        for text, label in zip(texts, labels)
+    ]
+    order = list(range(len(examples)))
+    rng = random.Random(seed)
+
+    for epoch in range(epochs):
+        rng.shuffle(order)
+        step = learning_rate / (1 + epoch)
+        for i in order:
+            indices, value, label = examples[i]
+            prediction = sigmoid(
+                classifier.bias + value * sum([weights[j] for j in indices])
+            )
+            gradient = prediction - label
+            for j in indices:
+                weights[j] -= step * (gradient * value + l2 * weights[j])
+            classifier.bias -= step * gradient
+
+    return classifier
+
+
+def detect_pi_using_classifier(
+    input: Union[str, PreparedInput], classifier: PromptInjectionClassifier
+) -> Dict[str, float]:
+    """
+    Scores the input with a local classifier.
+
+    Args:
+        input (Union[str, PreparedInput]): The input to be checked for prompt injection.
+        classifier (PromptInjectionClassifier): The trained classifier.
+
+    Returns:
+        Dict[str, float]: The classifier score under "score".
+    """
+    return {"score": classifier.score(input)}
@@ -1,6 +1,28 @@
+import os
 import re
+from collections import deque
 from difflib import SequenceMatcher
-from typing import List
+from functools import lru_cache
+from typing import (
+    IO,
+    Deque,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Sequence,
+    Set,
+    Tuple,
+    TYPE_CHECKING,
+    Union,
+)
+
+from .prepared_input import PreparedInput, fold_text, normalize_text
+
+if TYPE_CHECKING:
+    from .heuristic_index import CompiledKeywordIndex
+
+MAX_MATCHED_WORDS = 5
 
 
 def generate_injection_keywords() -> List[str]:
@@ -144,35 +166,348 @@ def get_matched_words_score(
     return base_score
 
 
-def detect_prompt_injection_using_heuristic_on_input(input: str) -> float:
-    highest_score = 0
-    max_matched_words = 5
+class KeywordTable:
+    """
+    The normalized injection keywords, grouped by their number of words and indexed by (word position, word) so that
+    only keywords sharing a word with an input window need to be scored.
+    """
 
-    all_injection_keywords_strings = generate_injection_keywords()
-    normalized_input_string = normalize_string(input)
+    def __init__(self, injection_keywords: Iterable[str]) -> None:
+        self.keywords: List[Tuple[str, Tuple[str, ...]]] = []
+        self.lengths: List[int] = []
+        self.positions: Dict[Tuple[int, int, str], List[int]] = {}
+
+        for keyword_string in injection_keywords:
+            normalized_keyword_string = normalize_text(keyword_string)
+            keyword_parts = tuple(normalized_keyword_string.split(" "))
+            keyword_index = len(self.keywords)
+            self.keywords.append((normalized_keyword_string, keyword_parts))
+            for position, part in enumerate(keyword_parts):
+                self.positions.setdefault(
+                    (len(keyword_parts), position, part), []
+                ).append(keyword_index)
+
+        self.lengths = sorted({len(parts) for _, parts in self.keywords})
+        self.max_length = self.lengths[-1] if self.lengths else 0
+
+    def candidates(self, keyword_length: int, window_words: Sequence[str]) -> Set[int]:
+        """
+        Returns the keywords of keyword_length words that share at least one word, in the same position, with the
+        window.
+        """
+        candidates: Set[int] = set()
+        for position, window_word in enumerate(window_words):
+            candidates.update(
+                self.positions.get((keyword_length, position, window_word), ())
+            )
+        return candidates
 
-    for keyword_string in all_injection_keywords_strings:
-        normalized_keyword_string = normalize_string(keyword_string)
-        keywords = normalized_keyword_string.split(" ")
-        # Generate substrings of similar length (to keyword length) in the input string
-        input_substrings = get_input_substrings(normalized_input_string, len(keywords))
+    def keyword(self, keyword_index: int) -> Tuple[str, Tuple[str, ...]]:
+        """
+        Returns the normalized keyword string and its words.
+        """
+        return self.keywords[keyword_index]
 
-        # Calculate the similarity score between the keywords and each substring
-        for substring in input_substrings:
-            similarity_score = SequenceMatcher(
-                None, substring, normalized_keyword_string
-            ).ratio()
 
-            matched_word_score = get_matched_words_score(
-                substring, keywords, max_matched_words
-            )
+@lru_cache(maxsize=1)
+def get_keyword_table() -> Union[KeywordTable, "CompiledKeywordIndex"]:
+    """
+    Returns the injection keyword table shared by every scan in the process. If the REBUFF_HEURISTIC_INDEX
+    environment variable names a file, the compiled index in it is memory-mapped instead, and rebuilt first if it is
+    missing or out of date, so that processes on a host share one copy of it.
+    """
+    index_path = os.environ.get("REBUFF_HEURISTIC_INDEX")
+    if index_path:
+        from .heuristic_index import load_compiled_index
 
-            # Adjust the score using the similarity score
-            adjusted_score = matched_word_score - similarity_score * (
-                1 / (max_matched_words * 2)
-            )
+        return load_compiled_index(index_path)
+    return KeywordTable(generate_injection_keywords())
 
-            if adjusted_score > highest_score:
-                highest_score = adjusted_score
 
-    return highest_score
+def longest_common_run(keyword_parts: Sequence[str], words: Sequence[str]) -> int:
+    """
+    Returns the length of the longest substring shared by the space-joined keyword and window that is made of words
+    matched in place, counting the spaces around it. Both have the same number of words, so a run of matched words
+    is surrounded by the same spaces in both strings.
+    """
+    longest = 0
+    run_start = 0
+    run_length = 0
+    for position, (part, word) in enumerate(zip(keyword_parts, words)):
+        if part != word:
+            run_length = 0
+            continue
+        if run_length == 0:
+            run_start = position
+            run_length = len(word)
+        else:
+            run_length += 1 + len(word)
+        spaces = (run_start > 0) + (position < len(words) - 1)
+        longest = max(longest, run_length + spaces)
+    return longest
+
+
+class HeuristicScanner:
+    """
+    Computes the heuristic prompt injection score of text fed to it in pieces, with memory independent of the length
+    of the text. Only the last few normalized words (as many as the longest keyword) and any word cut off at the end
+    of the last piece are kept, and every window of words is scored once when its last word arrives.
+
+    The score is the same as detect_prompt_injection_using_heuristic_on_input would return for the concatenated text.
+    """
+
+    def __init__(
+        self, keyword_table: Union[KeywordTable, "CompiledKeywordIndex", None] = None
+    ) -> None:
+        self.keyword_table = keyword_table or get_keyword_table()
+        self.highest_score: float = 0
+        self._window: Deque[str] = deque(maxlen=self.keyword_table.max_length)
+        self._partial_word: List[str] = []
+
+    def feed(self, text: str) -> float:
+        """
+        Scans the next piece of text. A word may be split across pieces.
+
+        Args:
+            text (str): The next piece of the input.
+
+        Returns:
+            float: The highest score seen so far, not counting a word still cut off at the end of text.
+        """
+        # Folding maps each character on its own, so pieces can be folded separately
+        text = fold_text(text)
+        if not text:
+            return self.highest_score
+
+        words = text.split()
+        starts_with_space = text[0].isspace()
+        ends_with_space = text[-1].isspace()
+
+        if len(words) == 1 and not starts_with_space and not ends_with_space:
+            # The piece continues the current word
+            self._partial_word.append(text)
+            return self.highest_score
+
+        if starts_with_space or not words:
+            self._flush_partial_word()
+        elif self._partial_word:
+            self._partial_word.append(words[0])
+            words[0] = "".join(self._partial_word)
+            self._partial_word = []
+
+        if words and not ends_with_space:
+            self._partial_word = [words.pop()]
+
+        for word in words:
+            self._push_word(word)
+
+        return self.highest_score
+
+    def feed_words(self, words: Iterable[str]) -> float:
+        """
+        Scans words that are already normalized, such as the tokens of a PreparedInput. A word cut off at the end of
+        the text fed before is taken to be complete.
+
+        Args:
+            words (Iterable[str]): The next normalized words of the input.
+
+        Returns:
+            float: The highest score seen so far.
+        """
+        self._flush_partial_word()
+        for word in words:
+            self._push_word(word)
+        return self.highest_score
+
+    def close(self) -> float:
+        """
+        Scans a word still cut off at the end of the input and returns the final score.
+
+        Returns:
+            float: The heuristic score of all the text fed so far.
+        """
+        self._flush_partial_word()
+        return self.highest_score
+
+    def copy(self) -> "HeuristicScanner":
+        """
+        Returns a scanner with the same state, that can be fed independently of this one.
+
+        Returns:
+            HeuristicScanner: The copy.
+        """
+        scanner = HeuristicScanner(self.keyword_table)
+        scanner.highest_score = self.highest_score
+        scanner._window.extend(self._window)
+        scanner._partial_word = list(self._partial_word)
+        return scanner
+
+    def _flush_partial_word(self) -> None:
+        if self._partial_word:
+            word = "".join(self._partial_word)
+            self._partial_word = []
+            self._push_word(word)
+
+    def _push_word(self, word: str) -> None:
+        self._window.append(word)
+        window = list(self._window)
+        table = self.keyword_table
+
+        for keyword_length in table.lengths:
+            if keyword_length > len(window):
+                break
+
+            window_words = window[len(window) - keyword_length :]
+
+            # A keyword without a word in the same position as the window scores at most 0, so it can never raise
+            # the highest score
+            candidates = table.candidates(keyword_length, window_words)
+            if not candidates:
+                continue
+
+            substring = " ".join(window_words)
+            scored_candidates = []
+            for keyword_index in candidates:
+                normalized_keyword_string, keywords = table.keyword(keyword_index)
+
+                matched_word_score = get_matched_words_score(
+                    substring, list(keywords), MAX_MATCHED_WORDS
+                )
+
+                # SequenceMatcher always finds the longest common substring, so words matched in place put a lower
+                # bound on the similarity score and so an upper bound on the adjusted score
+                min_similarity_score = (
+                    2.0
+                    * longest_common_run(keywords, window_words)
+                    / (len(substring) + len(normalized_keyword_string))
+                )
+                max_adjusted_score = matched_word_score - min_similarity_score * (
+                    1 / (MAX_MATCHED_WORDS * 2)
+                )
+                scored_candidates.append(
+                    (max_adjusted_score, matched_word_score, normalized_keyword_string)
+                )
+
+            # Best candidates first, so that the bound rules out as many of the rest as possible
+            scored_candidates.sort(reverse=True)
+            for (
+                max_adjusted_score,
+                matched_word_score,
+                normalized_keyword_string,
+            ) in scored_candidates:
+                if max_adjusted_score <= self.highest_score:
+                    break
+
+                similarity_score = SequenceMatcher(
+                    None, substring, normalized_keyword_string
+                ).ratio()
+
+                # Adjust the score using the similarity score
+                adjusted_score = matched_word_score - similarity_score * (
+                    1 / (MAX_MATCHED_WORDS * 2)
+                )
+
+                if adjusted_score > self.highest_score:
+                    self.highest_score = adjusted_score
+
+
+class ConversationScanner:
+    """
+    Keeps the heuristic score of a conversation up to date as messages are appended, so that each turn only scans
+    the new message instead of the whole transcript. The trailing words of previous messages are kept, so keywords
+    spanning messages are still found.
+
+    After every message the score is the same as detect_prompt_injection_using_heuristic_on_input would return for
+    separator.join(messages).
+    """
+
+    def __init__(
+        self,
+        separator: str = "\n",
+        keyword_table: Union[KeywordTable, "CompiledKeywordIndex", None] = None,
+    ) -> None:
+        """
+        Args:
+            separator (str, optional): The text placed between messages in the transcript. Defaults to "\n".
+            keyword_table (Union[KeywordTable, CompiledKeywordIndex, None], optional): The keywords to scan for.
+                Defaults to the injection keywords.
+        """
+        self.separator = separator
+        self.message_count = 0
+        self.score: float = 0
+        self._scanner = HeuristicScanner(keyword_table)
+
+    def add_message(self, message: str) -> float:
+        """
+        Scans a message appended to the conversation.
+
+        Args:
+            message (str): The new message.
+
+        Returns:
+            float: The heuristic score of the whole conversation so far.
+        """
+        if self.message_count:
+            self._scanner.feed(self.separator)
+        self._scanner.feed(message)
+        self.message_count += 1
+
+        # The last word of the transcript may still be continued by the next message, score it on a copy so that
+        # its windows are only committed once the word is complete
+        self.score = self._scanner.copy().close()
+        return self.score
+
+
+def iter_text_chunks(
+    source: Union[str, IO[str], Iterable[str]], chunk_size: int = 64 * 1024
+) -> Iterator[str]:
+    """
+    Yields the text of a string, a text file-like object or an iterable of strings in pieces of bounded size.
+
+    Args:
+        source (Union[str, IO[str], Iterable[str]]): The text to read.
+        chunk_size (int, optional): The number of characters read at a time from a string or file. Defaults to 64K.
+
+    Returns:
+        Iterator[str]: The pieces of text, in order.
+    """
+    if isinstance(source, str):
+        for start in range(0, len(source), chunk_size):
+            yield source[start : start + chunk_size]
+    elif hasattr(source, "read"):
+        while True:
+            chunk = source.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+    else:
+        yield from source
+
+
+def detect_prompt_injection_using_heuristic_on_stream(
+    source: Union[str, IO[str], Iterable[str]], chunk_size: int = 64 * 1024
+) -> float:
+    """
+    Computes the heuristic prompt injection score of a string, text file-like object or iterable of text chunks
+    without holding more than one chunk of it in memory.
+
+    Args:
+        source (Union[str, IO[str], Iterable[str]]): The input to be checked for prompt injection.
+        chunk_size (int, optional): The number of characters read at a time from a string or file. Defaults to 64K.
+
+    Returns:
+        float: The heuristic score, the same as detect_prompt_injection_using_heuristic_on_input gives for the text.
+    """
+    scanner = HeuristicScanner()
+    for chunk in iter_text_chunks(source, chunk_size):
+        scanner.feed(chunk)
+    return scanner.close()
+
+
+def detect_prompt_injection_using_heuristic_on_input(
+    input: Union[str, PreparedInput]
+) -> float:
+    if isinstance(input, PreparedInput):
+        scanner = HeuristicScanner()
+        return scanner.feed_words(input.tokens)
+    return detect_prompt_injection_using_heuristic_on_stream(input)
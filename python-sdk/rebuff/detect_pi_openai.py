@@ -1,7 +1,5 @@
 from typing import Dict
 
-from openai import OpenAI
-
 
 def render_prompt_for_pi_detection(user_input: str) -> str:
     return f"""
@@ -67,6 +65,9 @@ def call_openai_to_detect_pi(
         Dict (str, float): The likelihood score that Open AI assign to user input for containing prompt injection
 
     """
+    # Imported on first use, the openai package is slow to import
+    from openai import OpenAI
+
     client = OpenAI(api_key=api_key)
 
     completion = client.chat.completions.create(
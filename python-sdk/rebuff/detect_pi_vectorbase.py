@@ -1,42 +1,117 @@
-from typing import Dict
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Sequence, Tuple
 
-import pinecone
-from langchain.vectorstores.pinecone import Pinecone
-from langchain_openai import OpenAIEmbeddings
+if TYPE_CHECKING:
+    from langchain.vectorstores.pinecone import Pinecone
+
+
+class PineconeVectorStore:
+    """
+    The Pinecone attack vault: the LangChain Pinecone store, which adds and searches documents, together with the
+    Pinecone index and embeddings it was built from. The vector check queries the index directly for ids and scores,
+    leaving out the metadata, which holds the leaked completions, and the vector values.
+    """
+
+    def __init__(
+        self,
+        store: "Pinecone",
+        index: Any,
+        embedding: Any,
+        text_key: str,
+        namespace: Optional[str] = None,
+    ) -> None:
+        """
+        Args:
+            store (Pinecone): The LangChain store over index.
+            index (Any): The Pinecone index.
+            embedding (Any): The LangChain Embeddings object that embeds the entries and queries.
+            text_key (str): The metadata field holding the text of each entry.
+            namespace (Optional[str], optional): The index namespace. Defaults to None.
+        """
+        self.store = store
+        self.index = index
+        self.embedding = embedding
+        self.text_key = text_key
+        self.namespace = namespace
+
+    def add_texts(
+        self,
+        texts: Sequence[str],
+        metadatas: Optional[Sequence[Dict[str, Any]]] = None,
+    ) -> List[str]:
+        return self.store.add_texts(
+            list(texts), None if metadatas is None else list(metadatas)
+        )
+
+    def similarity_search_with_score(self, query: str, k: int = 4) -> Any:
+        return self.store.similarity_search_with_score(query, k)
+
+    def similarity_search_ids_with_score(
+        self, query: str, k: int, score_threshold: Optional[float] = None
+    ) -> List[Tuple[str, float]]:
+        """
+        Returns the ids and scores of the k entries closest to query, highest first.
+
+        Args:
+            query (str): The text to search for.
+            k (int): The number of entries to return.
+            score_threshold (Optional[float], optional): Leave out entries scoring below it. Defaults to None.
+
+        Returns:
+            List[Tuple[str, float]]: The id and cosine similarity of each entry.
+        """
+        response = self.index.query(
+            vector=self.embedding.embed_query(query),
+            top_k=k,
+            include_metadata=False,
+            include_values=False,
+            namespace=self.namespace,
+            # LangChain skips entries without text, so the index does too, without returning metadata
+            filter={self.text_key: {"$exists": True}},
+        )
+        return [
+            (match["id"], match["score"])
+            for match in response["matches"]
+            if match["score"] is not None
+            and (score_threshold is None or match["score"] >= score_threshold)
+        ]
 
 
 # https://api.python.langchain.com/en/latest/vectorstores/langchain.vectorstores.pinecone.Pinecone.html
 def detect_pi_using_vector_database(
-    input: str, similarity_threshold: float, vector_store: Pinecone
-) -> Dict:
+    input: str,
+    similarity_threshold: float,
+    vector_store: Any,
+    top_k: int = 20,
+    score_threshold: Optional[float] = None,
+) -> Dict[str, float]:
     """
     Detects Prompt Injection using similarity search with vector database.
 
     Args:
         input (str): user input to be checked for prompt injection
         similarity_threshold (float): The threshold for similarity between entries in vector database and the user input.
-        vector_store (Pinecone): Vector database of prompt injections
+        vector_store (Any): Vector database of prompt injections, such as a PineconeVectorStore or QuantizedVectorStore
+        top_k (int, optional): The number of most similar entries to score. Only the best one decides top_score, so 1
+                               is enough for the verdict. Defaults to 20.
+        score_threshold (Optional[float], optional): Leave out entries scoring below it. top_score is then 0 for
+                                                     inputs with no entry at or above it. Defaults to None.
 
     Returns:
         Dict (str, Union[float, int]): top_score (float) that contains the highest score wrt similarity between vector database and the user input.
-                                        count_over_max_vector_score (int) holds the count for times the similarity score (between vector database and the user input)
-                                        came out more than the top_score and similarty_threshold.
+                                        count_over_max_vector_score (int) holds the count of entries whose similarity score (between vector database and the user input)
+                                        is at or above the similarity_threshold.
     """
 
-    top_k = 20
-    results = vector_store.similarity_search_with_score(input, top_k)
+    scores = query_similarity_scores(vector_store, input, top_k, score_threshold)
 
-    top_score = 0
+    top_score = 0.0
     count_over_max_vector_score = 0
 
-    for _, score in results:
-        if score is None:
-            continue
-
+    for score in scores:
         if score > top_score:
             top_score = score
 
-        if score >= similarity_threshold and score > top_score:
+        if score >= similarity_threshold:
             count_over_max_vector_score += 1
 
     vector_score = {
@@ -47,9 +122,47 @@ def detect_pi_using_vector_database(
     return vector_score
 
 
+def query_similarity_scores(
+    vector_store: Any,
+    input: str,
+    top_k: int,
+    score_threshold: Optional[float] = None,
+) -> List[float]:
+    """
+    Returns the similarity scores of the top_k entries closest to the input, fetching as little else as the vector
+    store allows. Stores with a similarity_search_ids_with_score method, like PineconeVectorStore and
+    QuantizedVectorStore, are asked for ids and scores alone. Any other store is searched with
+    similarity_search_with_score.
+
+    Args:
+        vector_store (Any): The vector store.
+        input (str): The user input.
+        top_k (int): The number of most similar entries to score.
+        score_threshold (Optional[float], optional): Leave out the scores below it. Defaults to None.
+
+    Returns:
+        List[float]: The scores, highest first.
+    """
+    if hasattr(vector_store, "similarity_search_ids_with_score"):
+        matches = vector_store.similarity_search_ids_with_score(
+            input, top_k, score_threshold
+        )
+        scores = [score for _, score in matches]
+    else:
+        results = vector_store.similarity_search_with_score(input, top_k)
+        scores = [score for _, score in results]
+
+    # Stores can't all filter by score, so the threshold is applied here for every store
+    return [
+        score
+        for score in scores
+        if score is not None and (score_threshold is None or score >= score_threshold)
+    ]
+
+
 def init_pinecone(
     environment: str, api_key: str, index: str, openai_api_key: str
-) -> Pinecone:
+) -> PineconeVectorStore:
     """
     Initializes connection with the Pinecone vector database using existing (rebuff) index.
 
@@ -60,7 +173,7 @@ def init_pinecone(
         openai_api_key (str): Open AI API key
 
     Returns:
-        vector_store (Pinecone)
+        vector_store (PineconeVectorStore)
 
     """
     if not environment:
@@ -68,14 +181,19 @@ def init_pinecone(
     if not api_key:
         raise ValueError("Pinecone apikey definition missing")
 
+    # Imported on first use, LangChain and Pinecone are slow to import
+    import pinecone
+    from langchain.vectorstores.pinecone import Pinecone
+    from langchain_openai import OpenAIEmbeddings
+
     pinecone.init(api_key=api_key, environment=environment)
 
     openai_embeddings = OpenAIEmbeddings(
         openai_api_key=openai_api_key, model="text-embedding-ada-002"
     )
 
-    vector_store = Pinecone.from_existing_index(
-        index, openai_embeddings, text_key="input"
-    )
+    # Built like Pinecone.from_existing_index, keeping the index and embeddings for score-only queries
+    pinecone_index = Pinecone.get_pinecone_index(index)
+    store = Pinecone(pinecone_index, openai_embeddings, text_key="input")
 
-    return vector_store
+    return PineconeVectorStore(store, pinecone_index, openai_embeddings, "input")
@@ -0,0 +1,262 @@
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+import tempfile
+from array import array
+from bisect import bisect_left
+from typing import Dict, List, Literal, Optional, Sequence, Set, Tuple
+
+from .detect_pi_heuristics import generate_injection_keywords
+from .prepared_input import normalize_text
+
+INDEX_MAGIC = b"RBHIDX\x00\x00"
+INDEX_FORMAT_VERSION = 2
+# Magic, format version and the length of the JSON header that follows
+INDEX_PREAMBLE = struct.Struct("=8sII")
+
+
+def keywords_digest(injection_keywords: Sequence[str]) -> str:
+    """
+    Returns a digest of the keyword list and the index format, stored in the index to tell when it is out of date.
+    """
+    digest = hashlib.sha256(f"{INDEX_FORMAT_VERSION}\n".encode())
+    for keyword in injection_keywords:
+        digest.update(keyword.encode() + b"\n")
+    return digest.hexdigest()
+
+
+def position_key(keyword_length: int, position: int, token_id: int) -> int:
+    return (keyword_length << 48) | (position << 32) | token_id
+
+
+def build_compiled_index(
+    path: str, injection_keywords: Optional[Sequence[str]] = None
+) -> None:
+    """
+    Compiles the injection keywords into an index file that CompiledKeywordIndex memory-maps.
+
+    After a JSON header, the file holds 8-byte aligned arrays in native byte order: the sorted token vocabulary, the
+    normalized keywords sorted by number of words with their token ids, the bucket of keywords of each length, and
+    the keywords having each token at each position. The file is written next to path and renamed into place, so
+    processes loading the index concurrently never see a partial file.
+
+    Args:
+        path (str): The index file to write.
+        injection_keywords (Optional[Sequence[str]], optional): The keywords to compile. Defaults to
+            generate_injection_keywords().
+    """
+    if injection_keywords is None:
+        injection_keywords = generate_injection_keywords()
+
+    normalized_keywords = [normalize_text(keyword) for keyword in injection_keywords]
+    keyword_parts = [keyword.split(" ") for keyword in normalized_keywords]
+    vocabulary = sorted({part for parts in keyword_parts for part in parts})
+    token_ids = {token: token_id for token_id, token in enumerate(vocabulary)}
+    # A stable sort keeps the keywords of each length in their original order
+    order = sorted(range(len(keyword_parts)), key=lambda i: len(keyword_parts[i]))
+
+    keyword_tokens = array("I")
+    keyword_token_offsets = array("I", [0])
+    buckets = array("I")
+    postings: Dict[int, List[int]] = {}
+    for keyword_index, original_index in enumerate(order):
+        parts = keyword_parts[original_index]
+        if not buckets or buckets[-3] != len(parts):
+            buckets.extend([len(parts), keyword_index, keyword_index])
+        buckets[-1] = keyword_index + 1
+        for position, part in enumerate(parts):
+            keyword_tokens.append(token_ids[part])
+            postings.setdefault(
+                position_key(len(parts), position, token_ids[part]), []
+            ).append(keyword_index)
+        keyword_token_offsets.append(len(keyword_tokens))
+
+    posting_keys = array("Q", sorted(postings))
+    posting_offsets = array("I", [0])
+    posting_ids = array("I")
+    for key in posting_keys:
+        posting_ids.extend(postings[key])
+        posting_offsets.append(len(posting_ids))
+
+    vocabulary_blob, vocabulary_offsets = pack_strings(vocabulary)
+    keyword_blob, keyword_offsets = pack_strings(
+        [normalized_keywords[i] for i in order]
+    )
+    sections = {
+        "vocabulary_blob": vocabulary_blob,
+        "vocabulary_offsets": vocabulary_offsets.tobytes(),
+        "keyword_blob": keyword_blob,
+        "keyword_offsets": keyword_offsets.tobytes(),
+        "keyword_tokens": keyword_tokens.tobytes(),
+        "keyword_token_offsets": keyword_token_offsets.tobytes(),
+        "buckets": buckets.tobytes(),
+        "posting_keys": posting_keys.tobytes(),
+        "posting_offsets": posting_offsets.tobytes(),
+        "posting_ids": posting_ids.tobytes(),
+    }
+
+    # Section offsets are relative to the end of the header, so the header can be written last
+    layout: Dict[str, Tuple[int, int]] = {}
+    body = bytearray()
+    for name, data in sections.items():
+        body.extend(bytes(-len(body) % 8))
+        layout[name] = (len(body), len(data))
+        body.extend(data)
+
+    header = json.dumps(
+        {
+            "digest": keywords_digest(injection_keywords),
+            "byteorder": sys.byteorder,
+            "sections": layout,
+        }
+    ).encode()
+    header += b" " * (-(INDEX_PREAMBLE.size + len(header)) % 8)
+
+    directory = os.path.dirname(os.path.abspath(path))
+    file_descriptor, temporary_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(file_descriptor, "wb") as f:
+            f.write(INDEX_PREAMBLE.pack(INDEX_MAGIC, INDEX_FORMAT_VERSION, len(header)))
+            f.write(header)
+            f.write(body)
+        os.replace(temporary_path, path)
+    except BaseException:
+        os.unlink(temporary_path)
+        raise
+
+
+def pack_strings(strings: Sequence[str]) -> Tuple[bytes, "array[int]"]:
+    blob = bytearray()
+    offsets = array("I", [0])
+    for string in strings:
+        blob.extend(string.encode())
+        offsets.append(len(blob))
+    return bytes(blob), offsets
+
+
+class CompiledKeywordIndex:
+    """
+    The injection keyword table read from a compiled index file through a read-only memory map. The arrays stay in the
+    page cache shared by every process mapping the file; only the small token vocabulary is copied into each process.
+    It offers the same lookups to HeuristicScanner as KeywordTable and gives the same scores.
+    """
+
+    def __init__(self, path: str) -> None:
+        """
+        Args:
+            path (str): The index file written by build_compiled_index.
+
+        Raises:
+            ValueError: If the file is not an index in the current format and byte order.
+        """
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        try:
+            magic, version, header_length = INDEX_PREAMBLE.unpack_from(self._mmap)
+        except struct.error:
+            raise ValueError(f"{path} is not a Rebuff heuristic index")
+        if magic != INDEX_MAGIC or version != INDEX_FORMAT_VERSION:
+            raise ValueError(f"{path} is not a version {INDEX_FORMAT_VERSION} index")
+        body_start = INDEX_PREAMBLE.size + header_length
+        header = json.loads(self._mmap[INDEX_PREAMBLE.size : body_start])
+        if header["byteorder"] != sys.byteorder:
+            raise ValueError(f"{path} was built on a {header['byteorder']}-endian host")
+        self.digest: str = header["digest"]
+
+        view = memoryview(self._mmap)
+
+        def section(name: str, item_format: Literal["B", "I", "Q"] = "B") -> memoryview:
+            offset, length = header["sections"][name]
+            start = body_start + offset
+            return view[start : start + length].cast(item_format)
+
+        self._keyword_blob = section("keyword_blob")
+        self._keyword_offsets = section("keyword_offsets", "I")
+        self._keyword_tokens = section("keyword_tokens", "I")
+        self._keyword_token_offsets = section("keyword_token_offsets", "I")
+        self._posting_keys = section("posting_keys", "Q")
+        self._posting_offsets = section("posting_offsets", "I")
+        self._posting_ids = section("posting_ids", "I")
+
+        vocabulary_blob = section("vocabulary_blob")
+        vocabulary_offsets = section("vocabulary_offsets", "I")
+        self.vocabulary: List[str] = [
+            bytes(vocabulary_blob[start:end]).decode()
+            for start, end in zip(vocabulary_offsets, vocabulary_offsets[1:])
+        ]
+        self.token_ids = {
+            token: token_id for token_id, token in enumerate(self.vocabulary)
+        }
+
+        buckets = section("buckets", "I")
+        self.lengths: List[int] = list(buckets[::3])
+        self.max_length = self.lengths[-1] if self.lengths else 0
+
+    def candidates(self, keyword_length: int, window_words: Sequence[str]) -> Set[int]:
+        """
+        Returns the keywords of keyword_length words that share at least one word, in the same position, with the
+        window.
+        """
+        candidates: Set[int] = set()
+        keys = self._posting_keys
+        for position, window_word in enumerate(window_words):
+            token_id = self.token_ids.get(window_word)
+            if token_id is None:
+                continue
+            key = position_key(keyword_length, position, token_id)
+            i = bisect_left(keys, key)
+            if i < len(keys) and keys[i] == key:
+                candidates.update(
+                    self._posting_ids[
+                        self._posting_offsets[i] : self._posting_offsets[i + 1]
+                    ]
+                )
+        return candidates
+
+    def keyword(self, keyword_index: int) -> Tuple[str, Tuple[str, ...]]:
+        """
+        Returns the normalized keyword string and its words.
+        """
+        start, end = self._keyword_offsets[keyword_index : keyword_index + 2]
+        token_start, token_end = self._keyword_token_offsets[
+            keyword_index : keyword_index + 2
+        ]
+        vocabulary = self.vocabulary
+        return (
+            bytes(self._keyword_blob[start:end]).decode(),
+            tuple(vocabulary[t] for t in self._keyword_tokens[token_start:token_end]),
+        )
+
+
+def load_compiled_index(
+    path: str, injection_keywords: Optional[Sequence[str]] = None
+) -> CompiledKeywordIndex:
+    """
+    Memory-maps the compiled index at path, first rebuilding it if it is missing, unreadable, or was compiled from
+    other keywords or by another version of Rebuff.
+
+    Args:
+        path (str): The index file.
+        injection_keywords (Optional[Sequence[str]], optional): The keywords the index must hold. Defaults to
+            generate_injection_keywords().
+
+    Returns:
+        CompiledKeywordIndex
+    """
+    if injection_keywords is None:
+        injection_keywords = generate_injection_keywords()
+    digest = keywords_digest(injection_keywords)
+
+    try:
+        index = CompiledKeywordIndex(path)
+        if index.digest == digest:
+            return index
+    except (OSError, ValueError, KeyError):
+        pass
+
+    build_compiled_index(path, injection_keywords)
+    return CompiledKeywordIndex(path)
@@ -0,0 +1,283 @@
+import time
+from contextlib import contextmanager
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Dict,
+    Iterator,
+    Optional,
+    Sequence,
+    TypeVar,
+)
+
+if TYPE_CHECKING:
+    from .sampling import ShadowResult
+
+T = TypeVar("T")
+
+
+class InstrumentationHook:
+    """
+    Receives timing and metrics events from RebuffSdk and Rebuff. Subclass it and override the methods you need, the
+    defaults do nothing.
+    """
+
+    def on_tactic(
+        self,
+        tactic: str,
+        seconds: float,
+        input_size: int,
+        error: Optional[BaseException] = None,
+    ) -> None:
+        """
+        Called after a tactic (or an API request) has run.
+
+        Args:
+            tactic (str): The tactic name, "heuristic", "classifier", "vector", "llm" or "api".
+            seconds (float): Wall time spent in the tactic.
+            input_size (int): The number of characters the tactic was given.
+            error (Optional[BaseException], optional): The exception the tactic raised, if any.
+        """
+
+    def on_wait(self, stage: str, seconds: float) -> None:
+        """
+        Called with the time work spent queued before a worker thread started it.
+
+        Args:
+            stage (str): What was waiting: "batch_queue" for the inputs of RebuffSdk.detect_injection_batch and the
+                chunks of Rebuff.detect_injection_batch, "stream_queue" for the inputs of detect_stream,
+                "chunk_queue" for the chunk scores of detect_injection_chunked, and "shadow_queue" for shadow runs.
+            seconds (float): The time spent waiting.
+        """
+
+    def on_cache(self, cache: str, hit: bool) -> None:
+        """
+        Called when a cached resource is looked up.
+
+        Args:
+            cache (str): The cache name.
+            hit (bool): Whether the lookup was served from the cache.
+        """
+
+    def on_shadow_result(self, result: "ShadowResult") -> None:
+        """
+        Called when a shadow tactic has scored an input after its verdict was returned.
+
+        Args:
+            result (ShadowResult): The shadow score and whether it agrees with the returned verdict.
+        """
+
+
+@contextmanager
+def timed_tactic(
+    hooks: Sequence[InstrumentationHook],
+    tactic: str,
+    input_size: int,
+    timings: Optional[Dict[str, float]] = None,
+) -> Iterator[None]:
+    """
+    Times the enclosed block and reports it to every hook, including the exception if the block raises.
+
+    Args:
+        hooks (Sequence[InstrumentationHook]): The hooks to notify.
+        tactic (str): The tactic name.
+        input_size (int): The number of characters the tactic was given.
+        timings (Optional[Dict[str, float]], optional): If given, the wall time is also stored here under tactic.
+    """
+    start = time.perf_counter()
+    error: Optional[BaseException] = None
+    try:
+        yield
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        seconds = time.perf_counter() - start
+        if timings is not None:
+            timings[tactic] = seconds
+        for hook in hooks:
+            hook.on_tactic(tactic, seconds, input_size, error)
+
+
+def timed_wait(
+    hooks: Sequence[InstrumentationHook], stage: str, func: Callable[..., T]
+) -> Callable[..., T]:
+    """
+    Wraps func, about to be submitted to a thread pool, so that it reports the time from now until a worker starts
+    running it to every hook.
+
+    Args:
+        hooks (Sequence[InstrumentationHook]): The hooks to notify.
+        stage (str): What is waiting.
+        func (Callable[..., T]): The function to submit.
+
+    Returns:
+        Callable[..., T]: func, reporting its queue wait when called.
+    """
+    submitted_at = time.perf_counter()
+
+    def run(*args: Any, **kwargs: Any) -> T:
+        seconds = time.perf_counter() - submitted_at
+        for hook in hooks:
+            hook.on_wait(stage, seconds)
+        return func(*args, **kwargs)
+
+    return run
+
+
+class OpenTelemetryHook(InstrumentationHook):
+    """
+    Records every tactic as an OpenTelemetry span named "rebuff.<tactic>". Requires the opentelemetry-api package.
+    """
+
+    def __init__(self, tracer: Optional[Any] = None) -> None:
+        """
+        Args:
+            tracer (Optional[Any], optional): The tracer to create spans with. Defaults to the global tracer
+                provider's "rebuff" tracer.
+        """
+        try:
+            from opentelemetry import trace
+        except ImportError:
+            raise ImportError(
+                "OpenTelemetryHook requires the opentelemetry-api package: pip install opentelemetry-api"
+            )
+
+        self._trace = trace
+        self.tracer = tracer or trace.get_tracer("rebuff")
+
+    def on_tactic(
+        self,
+        tactic: str,
+        seconds: float,
+        input_size: int,
+        error: Optional[BaseException] = None,
+    ) -> None:
+        end_time = time.time_ns()
+        span = self.tracer.start_span(
+            f"rebuff.{tactic}",
+            start_time=end_time - int(seconds * 1e9),
+            attributes={"rebuff.tactic": tactic, "rebuff.input_size": input_size},
+        )
+        if error is not None:
+            span.record_exception(error)
+            span.set_status(self._trace.Status(self._trace.StatusCode.ERROR))
+        span.end(end_time=end_time)
+
+    def on_wait(self, stage: str, seconds: float) -> None:
+        end_time = time.time_ns()
+        span = self.tracer.start_span(
+            f"rebuff.wait.{stage}",
+            start_time=end_time - int(seconds * 1e9),
+            attributes={"rebuff.stage": stage},
+        )
+        span.end(end_time=end_time)
+
+    def on_cache(self, cache: str, hit: bool) -> None:
+        span = self._trace.get_current_span()
+        span.add_event("rebuff.cache", {"rebuff.cache": cache, "rebuff.cache_hit": hit})
+
+    def on_shadow_result(self, result: "ShadowResult") -> None:
+        # Shadow tactics run after the request's span has ended, so the result gets a span of its own
+        span = self.tracer.start_span(
+            f"rebuff.shadow.{result.tactic}",
+            attributes={
+                "rebuff.tactic": result.tactic,
+                "rebuff.shadow_score": result.score,
+                "rebuff.shadow_detected": result.shadow_detected,
+                "rebuff.injection_detected": result.injection_detected,
+                "rebuff.disagreement": result.disagrees,
+            },
+        )
+        span.end()
+
+
+class PrometheusHook(InstrumentationHook):
+    """
+    Exports Prometheus counters and histograms for tactic latency, errors, input sizes, waits, cache lookups and
+    shadow results. Requires the prometheus_client package.
+    """
+
+    def __init__(
+        self, registry: Optional[Any] = None, namespace: str = "rebuff"
+    ) -> None:
+        """
+        Args:
+            registry (Optional[Any], optional): The CollectorRegistry to register the metrics with. Defaults to the
+                global registry.
+            namespace (str, optional): The metric name prefix. Defaults to "rebuff".
+        """
+        try:
+            import prometheus_client
+        except ImportError:
+            raise ImportError(
+                "PrometheusHook requires the prometheus_client package: pip install prometheus_client"
+            )
+
+        registry = registry or prometheus_client.REGISTRY
+        self.tactic_seconds = prometheus_client.Histogram(
+            "tactic_duration_seconds",
+            "Wall time spent in each detection tactic",
+            ["tactic"],
+            namespace=namespace,
+            registry=registry,
+        )
+        self.tactic_errors = prometheus_client.Counter(
+            "tactic_errors_total",
+            "Detection tactics that raised an error",
+            ["tactic"],
+            namespace=namespace,
+            registry=registry,
+        )
+        self.input_size = prometheus_client.Histogram(
+            "input_size_chars",
+            "Number of characters given to each detection tactic",
+            ["tactic"],
+            namespace=namespace,
+            registry=registry,
+            buckets=(64, 256, 1024, 4096, 16384, 65536, 262144, 1048576),
+        )
+        self.wait_seconds = prometheus_client.Histogram(
+            "wait_duration_seconds",
+            "Time work spent queued before it started",
+            ["stage"],
+            namespace=namespace,
+            registry=registry,
+        )
+        self.cache_lookups = prometheus_client.Counter(
+            "cache_lookups_total",
+            "Cache lookups by result",
+            ["cache", "result"],
+            namespace=namespace,
+            registry=registry,
+        )
+        self.shadow_results = prometheus_client.Counter(
+            "shadow_results_total",
+            "Shadow tactic runs by whether they agreed with the returned verdict",
+            ["tactic", "outcome"],
+            namespace=namespace,
+            registry=registry,
+        )
+
+    def on_tactic(
+        self,
+        tactic: str,
+        seconds: float,
+        input_size: int,
+        error: Optional[BaseException] = None,
+    ) -> None:
+        self.tactic_seconds.labels(tactic).observe(seconds)
+        self.input_size.labels(tactic).observe(input_size)
+        if error is not None:
+            self.tactic_errors.labels(tactic).inc()
+
+    def on_wait(self, stage: str, seconds: float) -> None:
+        self.wait_seconds.labels(stage).observe(seconds)
+
+    def on_cache(self, cache: str, hit: bool) -> None:
+        self.cache_lookups.labels(cache, "hit" if hit else "miss").inc()
+
+    def on_shadow_result(self, result: "ShadowResult") -> None:
+        outcome = "disagree" if result.disagrees else "agree"
+        self.shadow_results.labels(result.tactic, outcome).inc()
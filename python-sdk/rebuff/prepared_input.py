@@ -0,0 +1,115 @@
+import hashlib
+import re
+import string
+import unicodedata
+from functools import cached_property
+from typing import Dict, List, Union
+
+WORD_CHARACTER = re.compile(r"\w")
+
+
+class FoldingTable(Dict[int, str]):
+    """
+    A str.translate table that folds each character to the form the tactics compare: NFKC-normalized and casefolded,
+    with whitespace mapped to a space and everything that is not a letter or digit removed. Entries are computed the
+    first time a character is seen, so the table only holds the characters that occur in the inputs.
+    """
+
+    def __missing__(self, code_point: int) -> str:
+        folded = unicodedata.normalize("NFKC", chr(code_point)).casefold()
+        mapped = "".join(
+            " "
+            if character.isspace()
+            else character
+            if character != "_" and WORD_CHARACTER.match(character)
+            else ""
+            for character in folded
+        )
+        self[code_point] = mapped
+        return mapped
+
+
+FOLDING_TABLE = FoldingTable()
+
+# The same folding for ASCII, applied to bytes which translate without a lookup per character
+ASCII_WHITESPACE = bytes(c for c in range(128) if chr(c).isspace())
+ASCII_FOLDING_TABLE = bytes.maketrans(
+    string.ascii_uppercase.encode() + ASCII_WHITESPACE,
+    string.ascii_lowercase.encode() + b" " * len(ASCII_WHITESPACE),
+)
+ASCII_REMOVED = bytes(
+    c for c in range(128) if not (chr(c).isalnum() or chr(c).isspace())
+)
+
+
+def fold_text(text: str) -> str:
+    """
+    Folds every character of the text, see FoldingTable. Words are left separated by runs of spaces.
+    """
+    if text.isascii():
+        return (
+            text.encode("ascii")
+            .translate(ASCII_FOLDING_TABLE, ASCII_REMOVED)
+            .decode("ascii")
+        )
+    return text.translate(FOLDING_TABLE)
+
+
+def normalize_text(text: str) -> str:
+    """
+    Normalizes text in a single translate pass: lower case and compatibility forms are folded, punctuation and
+    underscores are removed and whitespace is collapsed to single spaces. For ASCII text the result is the same as
+    normalize_string.
+
+    Args:
+        text (str): The text to normalize.
+
+    Returns:
+        str: The normalized text.
+    """
+    return " ".join(fold_text(text).split())
+
+
+class PreparedInput:
+    """
+    A user input together with the forms the tactics and caches need, computed once per detection and shared by all
+    of them.
+    """
+
+    def __init__(self, text: str) -> None:
+        """
+        Args:
+            text (str): The raw user input.
+        """
+        self.text = text
+        self.tokens: List[str] = fold_text(text).split()
+
+    @cached_property
+    def normalized(self) -> str:
+        """
+        The normalized input, its tokens joined by single spaces.
+        """
+        return " ".join(self.tokens)
+
+    @property
+    def token_count(self) -> int:
+        return len(self.tokens)
+
+    @cached_property
+    def content_hash(self) -> str:
+        """
+        A SHA-256 hex digest of the raw input, suitable as a cache or sampling key.
+        """
+        return hashlib.sha256(self.text.encode("utf-8", "surrogatepass")).hexdigest()
+
+    def __len__(self) -> int:
+        return len(self.text)
+
+
+def prepare_input(user_input: Union[str, PreparedInput]) -> PreparedInput:
+    """
+    Returns the prepared form of a user input, or the input itself if it is already prepared.
+    """
+    if isinstance(user_input, PreparedInput):
+        return user_input
+    return PreparedInput(user_input)
@@ -0,0 +1,384 @@
+import json
+import os
+import tempfile
+import threading
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Sequence, Tuple, cast
+
+if TYPE_CHECKING:
+    import numpy
+    from numpy.typing import NDArray
+    from langchain_core.documents import Document
+
+STORE_FORMAT_VERSION = 1
+HEADER_FILE = "store.json"
+# int8 codes, one row of dimensions per vector
+CODES_FILE = "codes.i8"
+# The float32 scale of each row of codes
+SCALES_FILE = "scales.f32"
+# The exact unit-length float32 vectors, read only to re-rank candidates
+VECTORS_FILE = "vectors.f32"
+# A JSON line with the text and metadata of each vector, and the uint64 offset of each line
+ENTRIES_FILE = "entries.jsonl"
+OFFSETS_FILE = "offsets.u64"
+
+
+def import_numpy() -> Any:
+    try:
+        import numpy
+    except ImportError:
+        raise ImportError(
+            "QuantizedVectorStore requires the numpy package: pip install rebuff[numpy]"
+        )
+    return numpy
+
+
+def quantize(
+    vectors: "NDArray[numpy.float32]",
+) -> Tuple["NDArray[numpy.int8]", "NDArray[numpy.float32]"]:
+    """
+    Quantizes each row to int8 with its own symmetric scale, so that row ~= codes * scale.
+
+    Args:
+        vectors (NDArray[numpy.float32]): A float32 matrix with a vector per row.
+
+    Returns:
+        Tuple[NDArray[numpy.int8], NDArray[numpy.float32]]: The int8 codes, and the float32 scale of each row.
+    """
+    numpy = import_numpy()
+    scales = numpy.abs(vectors).max(axis=1) / 127
+    scales[scales == 0] = 1
+    codes = numpy.rint(vectors / scales[:, None]).astype(numpy.int8)
+    return codes, scales.astype(numpy.float32)
+
+
+class QuantizedVectorStore:
+    """
+    A local store of attack embeddings for the vector check, searched in two stages. Vectors are stored as int8 codes
+    with a scale per vector, a quarter of their float32 size, and a scan of the codes shortlists the candidates. The
+    shortlist is then re-ranked by exact cosine similarity, reading the float32 vectors of those candidates alone from
+    disk. Every file is memory-mapped, so the worker processes of a host share a single copy in the page cache.
+
+    It has the similarity_search_with_score and add_texts methods used by the vector check and log_leakage, so it
+    can take the place of the Pinecone store: rb.vector_store = QuantizedVectorStore(path, embedding).
+    Only one process should add to a store at a time.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        embedding: Optional[Any] = None,
+        dimensions: Optional[int] = None,
+        rerank_candidates: int = 64,
+        block_rows: int = 1024,
+    ) -> None:
+        """
+        Args:
+            path (str): The store directory. It is created if it doesn't hold a store yet.
+            embedding (Optional[Any], optional): A LangChain Embeddings object that embeds the texts, for example
+                OpenAIEmbeddings(model="text-embedding-ada-002"). Only needed to add and search by text.
+            dimensions (Optional[int], optional): The number of dimensions of the vectors, needed to create a store.
+            rerank_candidates (int, optional): The number of candidates re-ranked with the exact vectors, raised to k
+                if smaller. More candidates improve recall and read more exact vectors. Defaults to 64.
+            block_rows (int, optional): The number of codes scored at a time, which bounds the memory used by a
+                scan and keeps each block in the CPU cache. Defaults to 1024.
+
+        Raises:
+            ValueError: If path holds a store in another format or with other dimensions, or if there is no store
+                and dimensions is not given.
+        """
+        self._numpy = import_numpy()
+        self.path = path
+        self.embedding = embedding
+        self.rerank_candidates = rerank_candidates
+        self.block_rows = block_rows
+        self._lock = threading.Lock()
+        self._maps: Optional[Dict[str, Any]] = None
+
+        header_path = os.path.join(path, HEADER_FILE)
+        if os.path.exists(header_path):
+            with open(header_path) as f:
+                header = json.load(f)
+            if header["format_version"] != STORE_FORMAT_VERSION:
+                raise ValueError(
+                    f"{path} is not a version {STORE_FORMAT_VERSION} vector store"
+                )
+            if dimensions is not None and dimensions != header["dimensions"]:
+                raise ValueError(
+                    f"{path} holds {header['dimensions']}-dimensional vectors, not {dimensions}"
+                )
+            self.dimensions: int = header["dimensions"]
+            self.count: int = header["count"]
+            self._entries_bytes: int = header["entries_bytes"]
+        else:
+            if dimensions is None:
+                raise ValueError("dimensions is needed to create a vector store")
+            os.makedirs(path, exist_ok=True)
+            self.dimensions = dimensions
+            self.count = 0
+            self._entries_bytes = 0
+            self._truncate_files()
+            self._write_header()
+
+    def __len__(self) -> int:
+        return self.count
+
+    @property
+    def memory_bytes(self) -> int:
+        """
+        The size of the data scanned by every search: the codes and their scales.
+        """
+        return self.count * (self.dimensions + 4)
+
+    def add_texts(
+        self,
+        texts: Sequence[str],
+        metadatas: Optional[Sequence[Dict[str, Any]]] = None,
+    ) -> List[str]:
+        """
+        Embeds and adds texts to the store.
+
+        Args:
+            texts (Sequence[str]): The texts to add.
+            metadatas (Optional[Sequence[Dict[str, Any]]], optional): The JSON-serializable metadata of each text.
+
+        Returns:
+            List[str]: The ids of the new entries.
+        """
+        vectors = self._require_embedding().embed_documents(list(texts))
+        return self.add_vectors(vectors, texts, metadatas)
+
+    def add_vectors(
+        self,
+        vectors: Any,
+        texts: Sequence[str],
+        metadatas: Optional[Sequence[Dict[str, Any]]] = None,
+    ) -> List[str]:
+        """
+        Adds embeddings that were computed elsewhere, for example exported from a Pinecone index.
+
+        Args:
+            vectors (Any): A matrix-like with a vector per text. Vectors are scaled to unit length.
+            texts (Sequence[str]): The text of each vector.
+            metadatas (Optional[Sequence[Dict[str, Any]]], optional): The JSON-serializable metadata of each text.
+
+        Returns:
+            List[str]: The ids of the new entries.
+        """
+        numpy = self._numpy
+        vectors = numpy.asarray(vectors, dtype=numpy.float32)
+        if vectors.ndim != 2 or vectors.shape[1] != self.dimensions:
+            raise ValueError(
+                f"Expected a matrix of {self.dimensions}-dimensional vectors"
+            )
+        if len(vectors) != len(texts) or (
+            metadatas is not None and len(metadatas) != len(texts)
+        ):
+            raise ValueError("vectors, texts and metadatas must have the same length")
+
+        norms = numpy.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1
+        vectors = vectors / norms
+        codes, scales = quantize(vectors)
+
+        with self._lock:
+            # Drop anything a failed add left after the last complete entry
+            self._truncate_files()
+            offsets = numpy.empty(len(texts), dtype=numpy.uint64)
+            entries_bytes = self._entries_bytes
+            with open(self._file(ENTRIES_FILE), "ab") as f:
+                for i, text in enumerate(texts):
+                    metadata = metadatas[i] if metadatas is not None else {}
+                    line = json.dumps({"text": text, "metadata": metadata}) + "\n"
+                    offsets[i] = entries_bytes
+                    entries_bytes += f.write(line.encode())
+            for name, data in (
+                (OFFSETS_FILE, offsets),
+                (CODES_FILE, codes),
+                (SCALES_FILE, scales),
+                (VECTORS_FILE, vectors),
+            ):
+                with open(self._file(name), "ab") as f:
+                    data.tofile(f)
+
+            first_id = self.count
+            # The entries only become visible once the header counts them
+            self.count += len(texts)
+            self._entries_bytes = entries_bytes
+            self._write_header()
+            self._maps = None
+
+        return [str(i) for i in range(first_id, self.count)]
+
+    def similarity_search_with_score(
+        self, query: str, k: int = 4
+    ) -> List[Tuple["Document", float]]:
+        """
+        Returns the k entries most similar to the query text, with their cosine similarity, most similar first.
+        """
+        vector = self._require_embedding().embed_query(query)
+        return [
+            (self.document(index), score)
+            for index, score in self.search_by_vector(vector, k)
+        ]
+
+    def similarity_search_ids_with_score(
+        self, query: str, k: int = 4, score_threshold: Optional[float] = None
+    ) -> List[Tuple[str, float]]:
+        """
+        Returns the ids and cosine similarities of the k entries most similar to the query text, most similar first,
+        without reading their texts or metadata.
+
+        Args:
+            query (str): The query text.
+            k (int, optional): The number of entries to return. Defaults to 4.
+            score_threshold (Optional[float], optional): Leave out the entries scoring below it. Defaults to None.
+
+        Returns:
+            List[Tuple[str, float]]
+        """
+        vector = self._require_embedding().embed_query(query)
+        return [
+            (str(index), score)
+            for index, score in self.search_by_vector(vector, k)
+            if score_threshold is None or score >= score_threshold
+        ]
+
+    def search_by_vector(self, vector: Any, k: int = 4) -> List[Tuple[int, float]]:
+        """
+        Finds the k entries most similar to a vector: the int8 codes are scanned for the best rerank_candidates
+        entries, which are then ranked by exact cosine similarity.
+
+        Args:
+            vector (Any): The query vector.
+            k (int, optional): The number of entries to return. Defaults to 4.
+
+        Returns:
+            List[Tuple[int, float]]: The index and exact cosine similarity of each entry, most similar first.
+        """
+        numpy = self._numpy
+        maps = self._mapped()
+        if maps is None or k < 1:
+            return []
+        query = self._unit_query(vector)
+        codes = maps["codes"]
+
+        approximate = numpy.empty(len(codes), dtype=numpy.float32)
+        for start in range(0, len(codes), self.block_rows):
+            end = start + self.block_rows
+            approximate[start:end] = codes[start:end].astype(numpy.float32) @ query
+        approximate *= maps["scales"]
+
+        shortlist_size = max(k, self.rerank_candidates)
+        if shortlist_size < len(codes):
+            shortlist = numpy.argpartition(-approximate, shortlist_size - 1)[
+                :shortlist_size
+            ]
+            # Reading the exact vectors in file order keeps the disk access sequential
+            shortlist.sort()
+        else:
+            shortlist = numpy.arange(len(codes))
+
+        exact = maps["vectors"][shortlist] @ query
+        order = numpy.argsort(-exact, kind="stable")[:k]
+        return [(int(shortlist[i]), float(exact[i])) for i in order]
+
+    def search_exact(self, vector: Any, k: int = 4) -> List[Tuple[int, float]]:
+        """
+        Finds the k entries most similar to a vector by scanning every exact vector. It is the reference
+        search_by_vector is measured against.
+        """
+        numpy = self._numpy
+        maps = self._mapped()
+        if maps is None or k < 1:
+            return []
+        query = self._unit_query(vector)
+        vectors = maps["vectors"]
+
+        scores = numpy.empty(len(vectors), dtype=numpy.float32)
+        for start in range(0, len(vectors), self.block_rows):
+            scores[start : start + self.block_rows] = (
+                vectors[start : start + self.block_rows] @ query
+            )
+        order = numpy.argsort(-scores, kind="stable")[:k]
+        return [(int(i), float(scores[i])) for i in order]
+
+    def document(self, index: int) -> "Document":
+        """
+        Returns the text and metadata of an entry as a LangChain Document.
+        """
+        from langchain_core.documents import Document
+
+        maps = self._mapped()
+        if maps is None or not 0 <= index < self.count:
+            raise IndexError(f"No entry {index} in the vector store")
+        with open(self._file(ENTRIES_FILE), "rb") as f:
+            f.seek(int(maps["offsets"][index]))
+            entry = json.loads(f.readline())
+        return Document(page_content=entry["text"], metadata=entry["metadata"])
+
+    def _mapped(self) -> Optional[Dict[str, Any]]:
+        if self.count == 0:
+            return None
+        maps = self._maps
+        if maps is None:
+            numpy = self._numpy
+            shape = (self.count, self.dimensions)
+            maps = {
+                "codes": numpy.memmap(
+                    self._file(CODES_FILE), numpy.int8, "r", shape=shape
+                ),
+                "scales": numpy.memmap(
+                    self._file(SCALES_FILE), numpy.float32, "r", shape=(self.count,)
+                ),
+                "vectors": numpy.memmap(
+                    self._file(VECTORS_FILE), numpy.float32, "r", shape=shape
+                ),
+                "offsets": numpy.memmap(
+                    self._file(OFFSETS_FILE), numpy.uint64, "r", shape=(self.count,)
+                ),
+            }
+            self._maps = maps
+        return maps
+
+    def _unit_query(self, vector: Any) -> "NDArray[numpy.float32]":
+        query = self._numpy.asarray(vector, dtype=self._numpy.float32).reshape(-1)
+        if len(query) != self.dimensions:
+            raise ValueError(f"Expected a {self.dimensions}-dimensional query vector")
+        norm = self._numpy.linalg.norm(query)
+        return cast("NDArray[numpy.float32]", query / norm if norm else query)
+
+    def _require_embedding(self) -> Any:
+        if self.embedding is None:
+            raise ValueError("Adding or searching by text needs an embedding")
+        return self.embedding
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def _truncate_files(self) -> None:
+        sizes = {
+            ENTRIES_FILE: self._entries_bytes,
+            OFFSETS_FILE: self.count * 8,
+            CODES_FILE: self.count * self.dimensions,
+            SCALES_FILE: self.count * 4,
+            VECTORS_FILE: self.count * self.dimensions * 4,
+        }
+        for name, size in sizes.items():
+            with open(self._file(name), "ab") as f:
+                f.truncate(size)
+
+    def _write_header(self) -> None:
+        header = {
+            "format_version": STORE_FORMAT_VERSION,
+            "dimensions": self.dimensions,
+            "count": self.count,
+            "entries_bytes": self._entries_bytes,
+        }
+        file_descriptor, temporary_path = tempfile.mkstemp(dir=self.path, suffix=".tmp")
+        try:
+            with os.fdopen(file_descriptor, "w") as f:
+                json.dump(header, f)
+            os.replace(temporary_path, self._file(HEADER_FILE))
+        except BaseException:
+            os.unlink(temporary_path)
+            raise
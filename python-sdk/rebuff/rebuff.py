@@ -1,8 +1,41 @@
+import gzip
+import json
 import secrets
-from typing import Any, Dict, Optional, Tuple, Union
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Literal,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+    overload,
+)
 
 import requests
 from pydantic import BaseModel
+from requests.adapters import HTTPAdapter
+
+from .instrumentation import InstrumentationHook, timed_tactic
+
+if TYPE_CHECKING:
+    from .columnar import DetectionColumns
+
+try:
+    import orjson
+except ImportError:
+    orjson = None  # type: ignore[assignment]
+
+SUPPORTED_COMPRESSIONS = ("gzip", "zstd")
+# The error servers that predate compact payloads return when userInputBase64 is missing
+LEGACY_MISSING_INPUT_MESSAGE = "userInput is required"
 
 
 class DetectApiRequest(BaseModel):
@@ -29,15 +62,70 @@ class DetectApiSuccessResponse(BaseModel):
     injectionDetected: bool
 
 
+class DetectApiBatchRequest(BaseModel):
+    userInputs: Optional[List[str]] = None
+    userInputsBase64: Optional[List[str]] = None
+    runHeuristicCheck: bool
+    runVectorCheck: bool
+    runLanguageModelCheck: bool
+    maxHeuristicScore: float
+    maxModelScore: float
+    maxVectorScore: float
+
+
+class DetectApiBatchSuccessResponse(BaseModel):
+    results: List[DetectApiSuccessResponse]
+
+
 class ApiFailureResponse(BaseModel):
     error: str
     message: str
 
 
+class CompactPayloadRejected(requests.HTTPError):
+    """
+    Raised when a server that predates compact payloads rejects one.
+    """
+
+
 class Rebuff:
-    def __init__(self, api_token: str, api_url: str = "https://playground.rebuff.ai"):
+    def __init__(
+        self,
+        api_token: str,
+        api_url: str = "https://playground.rebuff.ai",
+        compact_payloads: bool = False,
+        compression: Optional[str] = None,
+        compression_threshold: int = 16 * 1024,
+        hooks: Optional[Sequence[InstrumentationHook]] = None,
+    ):
+        """
+        Args:
+            api_token (str): The Rebuff API token.
+            api_url (str, optional): The URL of the Rebuff API. Defaults to "https://playground.rebuff.ai".
+            compact_payloads (bool, optional): Send each input once as plain text instead of alongside its hex
+                encoding. If the server predates compact payloads, which it reports by answering that userInput is
+                required, the client sends the full payload from then on. Defaults to False.
+            compression (Optional[str], optional): Compress request bodies with "gzip" or "zstd". zstd needs the
+                zstandard package and a server on Node 22.15 or later. The client stops compressing if the server
+                answers 415. Defaults to None.
+            compression_threshold (int, optional): The minimum body size in bytes to compress. Defaults to 16 KiB.
+            hooks (Optional[Sequence[InstrumentationHook]], optional): Hooks notified of the time spent in each API
+                request (as the "api" tactic) and of batch chunks waiting for a free connection.
+        """
+        if compression is not None and compression not in SUPPORTED_COMPRESSIONS:
+            raise ValueError(
+                f"compression must be one of {SUPPORTED_COMPRESSIONS}, but was {compression!r}"
+            )
+
         self.api_token = api_token
         self.api_url = api_url
+        self.compact_payloads = compact_payloads
+        self.compression = compression
+        self.compression_threshold = compression_threshold
+        self.hooks: List[InstrumentationHook] = list(hooks or [])
+        # Set once a server has accepted a compact payload
+        self._compact_confirmed = False
+        self._lock = threading.Lock()
         self._headers = {
             "Authorization": f"Bearer {self.api_token}",
             "Content-Type": "application/json",
@@ -69,40 +157,275 @@ class Rebuff:
             Tuple[Union[DetectApiSuccessResponse, ApiFailureResponse], bool]: A tuple containing the detection
                 metrics and a boolean indicating if an injection was detected.
         """
-        request_data = DetectApiRequest(
-            userInput=user_input,
-            userInputBase64=encode_string(user_input),
-            runHeuristicCheck=check_heuristic,
-            runVectorCheck=check_vector,
-            runLanguageModelCheck=check_llm,
-            maxVectorScore=max_vector_score,
-            maxModelScore=max_model_score,
-            maxHeuristicScore=max_heuristic_score,
+
+        def build_request(compact: bool) -> DetectApiRequest:
+            return DetectApiRequest(
+                userInput=user_input,
+                userInputBase64=None if compact else encode_string(user_input),
+                runHeuristicCheck=check_heuristic,
+                runVectorCheck=check_vector,
+                runLanguageModelCheck=check_llm,
+                maxVectorScore=max_vector_score,
+                maxModelScore=max_model_score,
+                maxHeuristicScore=max_heuristic_score,
+            )
+
+        compact = self.compact_payloads
+        try:
+            response = self._post_detect_request(
+                build_request, compact, len(user_input), has_empty_input=not user_input
+            )
+        except CompactPayloadRejected:
+            self._disable_compact_payloads()
+            response = self._post_detect_request(build_request, False, len(user_input))
+
+        # Parsing and validating the JSON in one step skips building the intermediate dicts
+        success_response = DetectApiSuccessResponse.model_validate_json(
+            response.content
         )
 
-        response = requests.post(
-            f"{self.api_url}/api/detect",
-            json=request_data.dict(),
-            headers=self._headers,
+        return apply_detection_thresholds(
+            success_response, max_heuristic_score, max_vector_score, max_model_score
         )
 
-        response.raise_for_status()
+    @overload
+    def detect_injection_batch(
+        self,
+        user_inputs: Sequence[str],
+        max_heuristic_score: float = ...,
+        max_vector_score: float = ...,
+        max_model_score: float = ...,
+        check_heuristic: bool = ...,
+        check_vector: bool = ...,
+        check_llm: bool = ...,
+        batch_size: int = ...,
+        max_batch_bytes: int = ...,
+        max_in_flight: int = ...,
+        *,
+        as_columns: Literal[False] = ...,
+    ) -> List[DetectApiSuccessResponse]:
+        ...
+
+    @overload
+    def detect_injection_batch(
+        self,
+        user_inputs: Sequence[str],
+        max_heuristic_score: float = ...,
+        max_vector_score: float = ...,
+        max_model_score: float = ...,
+        check_heuristic: bool = ...,
+        check_vector: bool = ...,
+        check_llm: bool = ...,
+        batch_size: int = ...,
+        max_batch_bytes: int = ...,
+        max_in_flight: int = ...,
+        *,
+        as_columns: Literal[True],
+    ) -> "DetectionColumns":
+        ...
+
+    def detect_injection_batch(
+        self,
+        user_inputs: Sequence[str],
+        max_heuristic_score: float = 0.75,
+        max_vector_score: float = 0.90,
+        max_model_score: float = 0.9,
+        check_heuristic: bool = True,
+        check_vector: bool = True,
+        check_llm: bool = True,
+        batch_size: int = 100,
+        max_batch_bytes: int = 512 * 1024,
+        max_in_flight: int = 4,
+        *,
+        as_columns: bool = False,
+    ) -> Union[List[DetectApiSuccessResponse], "DetectionColumns"]:
+        """
+        Detects injection attempts in many user inputs using the batch form of the detect API.
 
-        response_json = response.json()
-        success_response = DetectApiSuccessResponse.parse_obj(response_json)
+        The inputs are split into chunks bounded by both the number of inputs and the encoded payload size, and up to
+        max_in_flight chunks are sent concurrently.
 
-        if (
-            success_response.heuristicScore > max_heuristic_score
-            or success_response.modelScore > max_model_score
-            or success_response.vectorScore["topScore"] > max_vector_score
-        ):
-            # Injection detected
-            success_response.injectionDetected = True
-            return success_response
-        else:
-            # No injection detected
-            success_response.injectionDetected = False
-            return success_response
+        Args:
+            user_inputs (Sequence[str]): The user inputs to be checked for injection.
+            max_heuristic_score (float, optional): The maximum heuristic score allowed. Defaults to 0.75.
+            max_vector_score (float, optional): The maximum vector score allowed. Defaults to 0.90.
+            max_model_score (float, optional): The maximum model (LLM) score allowed. Defaults to 0.9.
+            check_heuristic (bool, optional): Whether to run the heuristic check. Defaults to True.
+            check_vector (bool, optional): Whether to run the vector check. Defaults to True.
+            check_llm (bool, optional): Whether to run the language model check. Defaults to True.
+            batch_size (int, optional): The maximum number of inputs sent in one request. Defaults to 100.
+            max_batch_bytes (int, optional): The maximum size of the encoded inputs sent in one request. An input
+                larger than this is sent on its own. Defaults to 512 KiB, which stays below the server's body limit.
+            max_in_flight (int, optional): The maximum number of concurrent requests. Defaults to 4.
+            as_columns (bool, optional): Return the results as a DetectionColumns, with one NumPy array per field
+                like RebuffSdk.detect_injection_batch. Requires the numpy package. Defaults to False.
+
+        Returns:
+            Union[List[DetectApiSuccessResponse], DetectionColumns]: One detection result per user input, in the same
+                order as user_inputs.
+        """
+        if batch_size < 1:
+            raise ValueError("batch_size must be at least 1")
+        if max_in_flight < 1:
+            raise ValueError("max_in_flight must be at least 1")
+
+        user_inputs = list(user_inputs)
+        input_sizes = [len(user_input.encode("utf-8")) for user_input in user_inputs]
+
+        def split(compact: bool) -> List[List[str]]:
+            # Hex encoding doubles the size of every input on the wire
+            bytes_per_byte = 1 if compact else 2
+            return [
+                user_inputs[start:end]
+                for start, end in chunk_bounds(
+                    [size * bytes_per_byte for size in input_sizes],
+                    batch_size,
+                    max_batch_bytes,
+                )
+            ]
+
+        # The payload form is fixed for the whole batch
+        compact = self.compact_payloads
+        chunks = split(compact)
+        if not chunks:
+            return to_batch_result([], as_columns)
+
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_maxsize=max_in_flight)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+
+        submitted_at = time.perf_counter()
+
+        def send_chunk(chunk: List[str]) -> List[DetectApiSuccessResponse]:
+            for hook in self.hooks:
+                hook.on_wait("batch_queue", time.perf_counter() - submitted_at)
+
+            def build_request(compact: bool) -> DetectApiBatchRequest:
+                return DetectApiBatchRequest(
+                    userInputs=chunk if compact else None,
+                    userInputsBase64=None
+                    if compact
+                    else [encode_string(user_input) for user_input in chunk],
+                    runHeuristicCheck=check_heuristic,
+                    runVectorCheck=check_vector,
+                    runLanguageModelCheck=check_llm,
+                    maxVectorScore=max_vector_score,
+                    maxModelScore=max_model_score,
+                    maxHeuristicScore=max_heuristic_score,
+                )
+
+            response = self._post_detect_request(
+                build_request,
+                compact,
+                sum(len(user_input) for user_input in chunk),
+                session,
+                has_empty_input=not all(chunk),
+            )
+
+            batch_response = DetectApiBatchSuccessResponse.model_validate_json(
+                response.content
+            )
+            if len(batch_response.results) != len(chunk):
+                raise ValueError(
+                    f"Expected {len(chunk)} results from the detect API, "
+                    f"but got {len(batch_response.results)}"
+                )
+
+            return [
+                apply_detection_thresholds(
+                    result, max_heuristic_score, max_vector_score, max_model_score
+                )
+                for result in batch_response.results
+            ]
+
+        results: List[DetectApiSuccessResponse] = []
+        with session:
+            if compact and not self._compact_confirmed:
+                # Send the first chunk alone to learn whether the server reads compact payloads, before the rest
+                # are sent concurrently
+                try:
+                    results.extend(send_chunk(chunks[0]))
+                    chunks = chunks[1:]
+                except CompactPayloadRejected:
+                    self._disable_compact_payloads()
+                    compact = False
+                    chunks = split(compact)
+
+            if chunks:
+                with ThreadPoolExecutor(
+                    max_workers=min(max_in_flight, len(chunks))
+                ) as executor:
+                    # map() yields in submission order, so results line up with user_inputs
+                    for chunk_results in executor.map(send_chunk, chunks):
+                        results.extend(chunk_results)
+
+        return to_batch_result(results, as_columns)
+
+    def _post_detect_request(
+        self,
+        build_request: Callable[[bool], BaseModel],
+        compact: bool,
+        input_size: int,
+        session: Optional[requests.Session] = None,
+        has_empty_input: bool = False,
+    ) -> requests.Response:
+        """
+        Posts a detect request, resending it uncompressed if the server cannot decode the compression.
+
+        Args:
+            build_request (Callable[[bool], BaseModel]): Builds the request, compact if its argument is True.
+            compact (bool): Whether to send the compact payload.
+            input_size (int): The number of characters of user input in the request, reported to the hooks.
+            session (Optional[requests.Session], optional): The session to send the request with.
+            has_empty_input (bool, optional): Whether the request holds an empty input. Every server answers that
+                userInput is required for one, so the answer says nothing about compact payloads. Defaults to False.
+
+        Returns:
+            requests.Response: The successful response.
+
+        Raises:
+            CompactPayloadRejected: If the request was compact and the server predates compact payloads. This is
+                only concluded before the server has accepted a compact payload.
+        """
+        body = dumps_json(build_request(compact).model_dump(exclude_none=compact))
+        compression = self.compression
+        while True:
+            headers = self._headers
+            data = body
+            if compression is not None and len(body) >= self.compression_threshold:
+                data = compress_body(body, compression)
+                headers = {**self._headers, "Content-Encoding": compression}
+
+            with timed_tactic(self.hooks, "api", input_size):
+                response = (session or requests).post(
+                    f"{self.api_url}/api/detect", data=data, headers=headers
+                )
+
+            if response.status_code == 415 and data is not body:
+                # The server cannot decode this encoding, so stop compressing
+                with self._lock:
+                    self.compression = None
+                compression = None
+                continue
+            if (
+                compact
+                and not self._compact_confirmed
+                and not has_empty_input
+                and is_legacy_missing_input(response)
+            ):
+                raise CompactPayloadRejected(
+                    "The server does not accept compact payloads", response=response
+                )
+
+            response.raise_for_status()
+            if compact:
+                self._compact_confirmed = True
+            return response
+
+    def _disable_compact_payloads(self) -> None:
+        with self._lock:
+            self.compact_payloads = False
 
     @staticmethod
     def generate_canary_word(length: int = 8) -> str:
@@ -207,5 +530,101 @@ class Rebuff:
         return
 
 
+def to_batch_result(
+    results: List[DetectApiSuccessResponse], as_columns: bool
+) -> Union[List[DetectApiSuccessResponse], "DetectionColumns"]:
+    if as_columns:
+        from .columnar import DetectionColumns
+
+        return DetectionColumns.from_api_responses(results)
+    return results
+
+
 def encode_string(message: str) -> str:
     return message.encode("utf-8").hex()
+
+
+def apply_detection_thresholds(
+    success_response: DetectApiSuccessResponse,
+    max_heuristic_score: float,
+    max_vector_score: float,
+    max_model_score: float,
+) -> DetectApiSuccessResponse:
+    if (
+        success_response.heuristicScore > max_heuristic_score
+        or success_response.modelScore > max_model_score
+        or success_response.vectorScore["topScore"] > max_vector_score
+    ):
+        # Injection detected
+        success_response.injectionDetected = True
+    else:
+        # No injection detected
+        success_response.injectionDetected = False
+
+    return success_response
+
+
+def is_legacy_missing_input(response: requests.Response) -> bool:
+    """
+    Returns whether the response is the error a server that predates compact payloads gives when
+    userInputBase64 is missing. Any other error, such as a failed check, is not a sign of a legacy server.
+    """
+    if response.status_code != 400:
+        return False
+    try:
+        body = response.json()
+    except ValueError:
+        return False
+    return (
+        isinstance(body, dict) and body.get("message") == LEGACY_MISSING_INPUT_MESSAGE
+    )
+
+
+def dumps_json(data: Dict[str, Any]) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def compress_body(body: bytes, compression: str) -> bytes:
+    if compression == "gzip":
+        # Level 6 is zlib's default and much cheaper than gzip's default of 9
+        return gzip.compress(body, compresslevel=6)
+    if compression == "zstd":
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError(
+                "zstd compression requires the zstandard package: pip install rebuff[zstd]"
+            )
+        return zstandard.ZstdCompressor().compress(body)
+    raise ValueError(f"Unsupported compression: {compression}")
+
+
+def chunk_bounds(
+    input_sizes: Sequence[int], batch_size: int, max_batch_bytes: int
+) -> Iterator[Tuple[int, int]]:
+    """
+    Splits inputs into consecutive chunks bounded by count and total size.
+
+    Args:
+        input_sizes (Sequence[int]): The size on the wire of each input.
+        batch_size (int): The maximum number of inputs per chunk.
+        max_batch_bytes (int): The maximum total size of the inputs in a chunk.
+
+    Returns:
+        Iterator[Tuple[int, int]]: The start and end index of each chunk, in input order.
+    """
+    start = 0
+    chunk_bytes = 0
+    for end, size in enumerate(input_sizes):
+        if end > start and (
+            end - start >= batch_size or chunk_bytes + size > max_batch_bytes
+        ):
+            yield start, end
+            start = end
+            chunk_bytes = 0
+        chunk_bytes += size
+
+    if len(input_sizes) > start:
+        yield start, len(input_sizes)
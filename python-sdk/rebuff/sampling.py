@@ -0,0 +1,190 @@
+import random
+import threading
+from collections import deque
+from typing import Deque, Dict, Mapping, Optional
+
+from pydantic import BaseModel
+
+from .instrumentation import InstrumentationHook
+from .prepared_input import PreparedInput
+
+
+class SamplingPolicy:
+    """
+    Decides whether a tactic runs on an input. RebuffSdk consults the policy configured for a tactic just before it
+    would run; the default runs it every time. Subclass it and override should_run, or use one of the policies below.
+    """
+
+    def should_run(
+        self,
+        tactic: str,
+        prepared: PreparedInput,
+        scores: Mapping[str, float],
+        tenant: Optional[str] = None,
+    ) -> bool:
+        """
+        Args:
+            tactic (str): The tactic about to run, "heuristic", "classifier", "vector" or "llm".
+            prepared (PreparedInput): The input.
+            scores (Mapping[str, float]): The scores of the tactics that have already run on the input, by name.
+            tenant (Optional[str], optional): The tenant passed to detect_injection.
+
+        Returns:
+            bool: Whether to run the tactic.
+        """
+        return True
+
+
+class FixedRateSampling(SamplingPolicy):
+    """
+    Runs the tactic on a random fraction of the inputs.
+    """
+
+    def __init__(self, rate: float, seed: Optional[int] = None) -> None:
+        """
+        Args:
+            rate (float): The fraction of inputs to run the tactic on, between 0 and 1.
+            seed (Optional[int], optional): Seeds the random choices, for reproducible tests. Defaults to None.
+        """
+        if not 0 <= rate <= 1:
+            raise ValueError("rate must be between 0 and 1")
+        self.rate = rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def should_run(
+        self,
+        tactic: str,
+        prepared: PreparedInput,
+        scores: Mapping[str, float],
+        tenant: Optional[str] = None,
+    ) -> bool:
+        return self._sample(self.rate)
+
+    def _sample(self, rate: float) -> bool:
+        if rate >= 1:
+            return True
+        with self._lock:
+            return self._random.random() < rate
+
+
+class TenantRateSampling(FixedRateSampling):
+    """
+    Runs the tactic on a random fraction of the inputs that depends on the tenant.
+    """
+
+    def __init__(
+        self,
+        rates: Mapping[str, float],
+        default_rate: float = 0.0,
+        seed: Optional[int] = None,
+    ) -> None:
+        """
+        Args:
+            rates (Mapping[str, float]): The fraction of inputs to run the tactic on, by tenant.
+            default_rate (float, optional): The fraction for tenants not in rates, and for inputs without a tenant.
+                Defaults to 0.0.
+            seed (Optional[int], optional): Seeds the random choices, for reproducible tests. Defaults to None.
+        """
+        super().__init__(default_rate, seed)
+        if not all(0 <= rate <= 1 for rate in rates.values()):
+            raise ValueError("rates must be between 0 and 1")
+        self.rates = dict(rates)
+
+    def should_run(
+        self,
+        tactic: str,
+        prepared: PreparedInput,
+        scores: Mapping[str, float],
+        tenant: Optional[str] = None,
+    ) -> bool:
+        rate = self.rates.get(tenant, self.rate) if tenant is not None else self.rate
+        return self._sample(rate)
+
+
+class ScoreThresholdSampling(SamplingPolicy):
+    """
+    Always runs the tactic when an earlier, cheaper tactic scored the input above a threshold, and otherwise defers to
+    another policy (by default, skips it).
+    """
+
+    def __init__(
+        self,
+        min_score: float,
+        gate_tactic: str = "heuristic",
+        otherwise: Optional[SamplingPolicy] = None,
+    ) -> None:
+        """
+        Args:
+            min_score (float): The gate tactic score above which the tactic always runs.
+            gate_tactic (str, optional): The tactic whose score is compared, it must run earlier: "heuristic", or
+                "classifier" for the vector and language model checks. Defaults to "heuristic".
+            otherwise (Optional[SamplingPolicy], optional): The policy for inputs at or below min_score, for example
+                a FixedRateSampling to keep a baseline. Defaults to None, which never runs the tactic.
+        """
+        self.min_score = min_score
+        self.gate_tactic = gate_tactic
+        self.otherwise = otherwise
+
+    def should_run(
+        self,
+        tactic: str,
+        prepared: PreparedInput,
+        scores: Mapping[str, float],
+        tenant: Optional[str] = None,
+    ) -> bool:
+        if scores.get(self.gate_tactic, 0.0) > self.min_score:
+            return True
+        if self.otherwise is None:
+            return False
+        return self.otherwise.should_run(tactic, prepared, scores, tenant)
+
+
+class ShadowResult(BaseModel):
+    tactic: str
+    score: float
+    max_score: float
+    # Whether the shadow tactic alone would have flagged the input
+    shadow_detected: bool
+    # The verdict returned to the caller without the shadow tactic
+    injection_detected: bool
+    content_hash: str
+    tenant: Optional[str] = None
+
+    @property
+    def disagrees(self) -> bool:
+        return self.shadow_detected != self.injection_detected
+
+
+class ShadowRecorder(InstrumentationHook):
+    """
+    Counts how often each shadow tactic agrees with the returned verdict and keeps the most recent disagreements.
+    """
+
+    def __init__(self, max_disagreements: int = 1000) -> None:
+        """
+        Args:
+            max_disagreements (int, optional): The number of recent disagreements kept. Defaults to 1000.
+        """
+        self.agreements: Dict[str, int] = {}
+        self.disagreement_counts: Dict[str, int] = {}
+        self.disagreements: Deque[ShadowResult] = deque(maxlen=max_disagreements)
+        self._lock = threading.Lock()
+
+    def on_shadow_result(self, result: ShadowResult) -> None:
+        with self._lock:
+            if result.disagrees:
+                counts = self.disagreement_counts
+                self.disagreements.append(result)
+            else:
+                counts = self.agreements
+            counts[result.tactic] = counts.get(result.tactic, 0) + 1
+
+    def disagreement_rate(self, tactic: str) -> float:
+        """
+        Returns the fraction of shadow runs of the tactic that disagreed with the returned verdict.
+        """
+        with self._lock:
+            disagreements = self.disagreement_counts.get(tactic, 0)
+            total = disagreements + self.agreements.get(tactic, 0)
+        return disagreements / total if total else 0.0
@@ -1,12 +1,83 @@
+import asyncio
+import math
 import secrets
-from typing import Optional, Tuple, Union
+import threading
+from collections import deque
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Future,
+    ThreadPoolExecutor,
+    as_completed,
+    wait,
+)
+from functools import partial
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    AsyncIterable,
+    AsyncIterator,
+    Callable,
+    Deque,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Mapping,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    Union,
+    cast,
+    overload,
+)
 
-from langchain_core.prompts import PromptTemplate
 from pydantic import BaseModel
 
+from .chunking import chunk_text_by_tokens
+from .detect_pi_classifier import PromptInjectionClassifier, detect_pi_using_classifier
 from .detect_pi_heuristics import detect_prompt_injection_using_heuristic_on_input
 from .detect_pi_openai import call_openai_to_detect_pi, render_prompt_for_pi_detection
+from .prepared_input import PreparedInput, prepare_input
 from .detect_pi_vectorbase import detect_pi_using_vector_database, init_pinecone
+from .instrumentation import InstrumentationHook, timed_tactic, timed_wait
+from .sampling import SamplingPolicy, ShadowResult
+
+if TYPE_CHECKING:
+    from langchain_core.prompts import PromptTemplate
+
+    from .columnar import DetectionColumns
+
+# The tactics detect_injection runs, in order
+TACTICS = ("heuristic", "classifier", "vector", "llm")
+
+
+def tactic_settings(
+    check_heuristic: bool,
+    check_classifier: bool,
+    check_vector: bool,
+    check_llm: bool,
+    max_heuristic_score: float,
+    max_classifier_score: float,
+    max_vector_score: float,
+    max_model_score: float,
+) -> Tuple[Dict[str, bool], Dict[str, float]]:
+    """
+    Returns whether each tactic is checked, and its threshold, by tactic name.
+    """
+    checks = {
+        "heuristic": check_heuristic,
+        "classifier": check_classifier,
+        "vector": check_vector,
+        "llm": check_llm,
+    }
+    thresholds = {
+        "heuristic": max_heuristic_score,
+        "classifier": max_classifier_score,
+        "vector": max_vector_score,
+        "llm": max_model_score,
+    }
+    return checks, thresholds
 
 
 class RebuffDetectionResponse(BaseModel):
@@ -20,6 +91,13 @@ class RebuffDetectionResponse(BaseModel):
     max_model_score: float
     max_vector_score: float
     injection_detected: bool
+    classifier_score: float = 0
+    run_classifier_check: bool = False
+    max_classifier_score: Optional[float] = None
+    timings: Optional[Dict[str, float]] = None
+    chunks_total: Optional[int] = None
+    chunks_scored: Optional[int] = None
+    input_index: Optional[int] = None
 
 
 class RebuffSdk:
@@ -30,13 +108,64 @@ class RebuffSdk:
         pinecone_environment: str,
         pinecone_index: str,
         openai_model: str = "gpt-3.5-turbo",
+        hooks: Optional[Sequence[InstrumentationHook]] = None,
+        classifier_path: Optional[str] = None,
+        sampling: Optional[Mapping[str, SamplingPolicy]] = None,
+        shadow_tactics: Optional[Sequence[str]] = None,
+        shadow_workers: int = 2,
+        max_shadow_pending: int = 100,
+        vector_top_k: int = 20,
+        vector_score_threshold: Optional[float] = None,
     ) -> None:
+        """
+        Args:
+            openai_apikey (str): The OpenAI API key.
+            pinecone_apikey (str): The Pinecone API key.
+            pinecone_environment (str): The Pinecone environment.
+            pinecone_index (str): The Pinecone index name.
+            openai_model (str, optional): The model used by the language model check. Defaults to "gpt-3.5-turbo".
+            hooks (Optional[Sequence[InstrumentationHook]], optional): Receive timing and metrics events.
+            classifier_path (Optional[str], optional): The classifier file used by the classifier check.
+            sampling (Optional[Mapping[str, SamplingPolicy]], optional): A sampling policy for any of the tactics,
+                by name ("heuristic", "classifier", "vector" or "llm"). A tactic is skipped on the inputs its
+                policy doesn't select. Tactics without a policy always run.
+            shadow_tactics (Optional[Sequence[str]], optional): Tactics that never delay or change the verdict. When
+                checked and sampled, they run in the background after detect_injection has returned, and each hook's
+                on_shadow_result gets their score and whether it agrees with the verdict.
+            shadow_workers (int, optional): The number of threads running shadow tactics. Defaults to 2.
+            max_shadow_pending (int, optional): The maximum number of shadow runs queued or in progress. Shadow runs
+                beyond it are dropped and counted in shadow_runs_dropped, so a slow backend can't build up an
+                unbounded backlog. Defaults to 100.
+            vector_top_k (int, optional): The number of most similar entries the vector check scores. The vector
+                score is the best of them, so 1 is enough for the verdict. Defaults to 20.
+            vector_score_threshold (Optional[float], optional): Leave out vector matches scoring below it. The vector
+                score is then 0 for inputs with no match at or above it. Defaults to None.
+        """
+        for tactic in list(sampling or []) + list(shadow_tactics or []):
+            if tactic not in TACTICS:
+                raise ValueError(
+                    f"Unknown tactic {tactic!r}, expected one of {', '.join(TACTICS)}"
+                )
         self.openai_model = openai_model
         self.openai_apikey = openai_apikey
         self.pinecone_apikey = pinecone_apikey
         self.pinecone_environment = pinecone_environment
         self.pinecone_index = pinecone_index
-        self.vector_store = None
+        # A PineconeVectorStore, QuantizedVectorStore or LangChain vector store, connected on first use
+        self.vector_store: Any = None
+        self.classifier_path = classifier_path
+        self.classifier: Optional[PromptInjectionClassifier] = None
+        self.hooks: List[InstrumentationHook] = list(hooks or [])
+        self.sampling: Dict[str, SamplingPolicy] = dict(sampling or {})
+        self.shadow_tactics: Tuple[str, ...] = tuple(shadow_tactics or ())
+        self.shadow_workers = shadow_workers
+        self.max_shadow_pending = max_shadow_pending
+        self.vector_top_k = vector_top_k
+        self.vector_score_threshold = vector_score_threshold
+        self.shadow_runs_dropped = 0
+        self._shadow_executor: Optional[ThreadPoolExecutor] = None
+        self._shadow_futures: Set["Future[None]"] = set()
+        self._shadow_lock = threading.Lock()
 
     def initialize_pinecone(self) -> None:
         self.vector_store = init_pinecone(
@@ -48,73 +177,297 @@ class RebuffSdk:
 
     def detect_injection(
         self,
-        user_input: str,
+        user_input: Union[str, PreparedInput],
         max_heuristic_score: float = 0.75,
         max_vector_score: float = 0.90,
         max_model_score: float = 0.90,
         check_heuristic: bool = True,
         check_vector: bool = True,
         check_llm: bool = True,
+        include_timings: bool = False,
+        check_classifier: bool = False,
+        max_classifier_score: float = 0.90,
+        tenant: Optional[str] = None,
     ) -> RebuffDetectionResponse:
         """
         Detects if the given user input contains an injection attempt.
 
+        The checked tactics run in order: heuristic, classifier, vector, then language model, each only if its
+        sampling policy selects the input. Policies see the scores of the tactics that ran before, so the expensive
+        checks can be gated on the cheap ones. Shadow tactics are left out of the verdict and run afterwards.
+
         Args:
-            user_input (str): The user input to be checked for injection.
+            user_input (Union[str, PreparedInput]): The user input to be checked for injection. It is normalized
+                once and shared by all the tactics; pass a PreparedInput to reuse one prepared elsewhere.
             max_heuristic_score (float, optional): The maximum heuristic score allowed. Defaults to 0.75.
             max_vector_score (float, optional): The maximum vector score allowed. Defaults to 0.90.
             max_model_score (float, optional): The maximum model (LLM) score allowed. Defaults to 0.90.
             check_heuristic (bool, optional): Whether to run the heuristic check. Defaults to True.
             check_vector (bool, optional): Whether to run the vector check. Defaults to True.
             check_llm (bool, optional): Whether to run the language model check. Defaults to True.
+            include_timings (bool, optional): Whether to include the wall time of each tactic, in seconds, in the
+                response. Defaults to False.
+            check_classifier (bool, optional): Whether to run the local classifier check, which needs
+                classifier_path. Defaults to False.
+            max_classifier_score (float, optional): The maximum classifier score allowed. Defaults to 0.90.
+            tenant (Optional[str], optional): The tenant the input comes from, passed to the sampling policies.
 
         Returns:
-            RebuffDetectionResponse
+            RebuffDetectionResponse: run_*_check is False for the tactics that were not run on the input, either
+                unchecked, not sampled, or shadowed.
         """
 
-        injection_detected = False
+        checks, thresholds = tactic_settings(
+            check_heuristic,
+            check_classifier,
+            check_vector,
+            check_llm,
+            max_heuristic_score,
+            max_classifier_score,
+            max_vector_score,
+            max_model_score,
+        )
+        timings: Dict[str, float] = {}
+        scores, injection_detected = self._score_input(
+            prepare_input(user_input), checks, thresholds, tenant, timings
+        )
 
-        if check_heuristic:
-            rebuff_heuristic_score = detect_prompt_injection_using_heuristic_on_input(
-                user_input
-            )
+        rebuff_response = RebuffDetectionResponse(
+            heuristic_score=scores.get("heuristic", 0.0),
+            openai_score=scores.get("llm", 0.0),
+            vector_score=scores.get("vector", 0.0),
+            run_heuristic_check="heuristic" in scores,
+            run_language_model_check="llm" in scores,
+            run_vector_check="vector" in scores,
+            max_heuristic_score=max_heuristic_score,
+            max_model_score=max_model_score,
+            max_vector_score=max_vector_score,
+            injection_detected=injection_detected,
+            classifier_score=scores.get("classifier", 0.0),
+            run_classifier_check="classifier" in scores,
+            max_classifier_score=max_classifier_score if check_classifier else None,
+            timings=timings if include_timings else None,
+        )
+        return rebuff_response
 
-        else:
-            rebuff_heuristic_score = 0
+    def detect_injection_batch(
+        self,
+        user_inputs: Sequence[Union[str, PreparedInput]],
+        max_heuristic_score: float = 0.75,
+        max_vector_score: float = 0.90,
+        max_model_score: float = 0.90,
+        check_heuristic: bool = True,
+        check_vector: bool = True,
+        check_llm: bool = True,
+        check_classifier: bool = False,
+        max_classifier_score: float = 0.90,
+        tenant: Optional[str] = None,
+        max_workers: int = 8,
+    ) -> "DetectionColumns":
+        """
+        Detects injection attempts in many user inputs and returns the results as columns. Each input is scored
+        like detect_injection, but the scores are written straight into the arrays of a DetectionColumns, without
+        building a response object per input. Requires the numpy package.
 
-        if check_vector:
-            self.initialize_pinecone()
+        Args:
+            user_inputs (Sequence[Union[str, PreparedInput]]): The user inputs to be checked for injection.
+            max_heuristic_score (float, optional): The maximum heuristic score allowed. Defaults to 0.75.
+            max_vector_score (float, optional): The maximum vector score allowed. Defaults to 0.90.
+            max_model_score (float, optional): The maximum model (LLM) score allowed. Defaults to 0.90.
+            check_heuristic (bool, optional): Whether to run the heuristic check. Defaults to True.
+            check_vector (bool, optional): Whether to run the vector check. Defaults to True.
+            check_llm (bool, optional): Whether to run the language model check. Defaults to True.
+            check_classifier (bool, optional): Whether to run the local classifier check, which needs
+                classifier_path. Defaults to False.
+            max_classifier_score (float, optional): The maximum classifier score allowed. Defaults to 0.90.
+            tenant (Optional[str], optional): The tenant the inputs come from, passed to the sampling policies.
+            max_workers (int, optional): The maximum number of inputs detected concurrently. Defaults to 8.
 
-            vector_score = detect_pi_using_vector_database(
-                user_input, max_vector_score, self.vector_store
+        Returns:
+            DetectionColumns: Row i holds the result for user_inputs[i].
+        """
+        from .columnar import DetectionColumns
+
+        if max_workers < 1:
+            raise ValueError("max_workers must be at least 1")
+
+        checks, thresholds = tactic_settings(
+            check_heuristic,
+            check_classifier,
+            check_vector,
+            check_llm,
+            max_heuristic_score,
+            max_classifier_score,
+            max_vector_score,
+            max_model_score,
+        )
+        if check_classifier:
+            self._ensure_classifier()
+        if check_vector:
+            self._ensure_vector_store()
+
+        columns = DetectionColumns.empty(len(user_inputs))
+        columns.max_heuristic_score[:] = max_heuristic_score
+        columns.max_model_score[:] = max_model_score
+        columns.max_vector_score[:] = max_vector_score
+        columns.max_classifier_score[:] = (
+            max_classifier_score if check_classifier else math.nan
+        )
+        score_columns = {
+            "heuristic": (columns.heuristic_score, columns.run_heuristic_check),
+            "classifier": (columns.classifier_score, columns.run_classifier_check),
+            "vector": (columns.vector_score, columns.run_vector_check),
+            "llm": (columns.openai_score, columns.run_language_model_check),
+        }
+
+        def detect(input_index: int) -> None:
+            scores, injection_detected = self._score_input(
+                prepare_input(user_inputs[input_index]), checks, thresholds, tenant
             )
-            rebuff_vector_score = vector_score["top_score"]
+            # Each input writes its own row, so the workers never write the same element
+            for tactic, score in scores.items():
+                score_column, run_column = score_columns[tactic]
+                score_column[input_index] = score
+                run_column[input_index] = True
+            columns.injection_detected[input_index] = injection_detected
+
+        if user_inputs:
+            with ThreadPoolExecutor(
+                max_workers=min(max_workers, len(user_inputs))
+            ) as executor:
+                # Consume the results so that an exception in any input is raised here
+                for _ in executor.map(
+                    timed_wait(self.hooks, "batch_queue", detect),
+                    range(len(user_inputs)),
+                ):
+                    pass
+        return columns
+
+    def detect_injection_chunked(
+        self,
+        user_input: str,
+        max_heuristic_score: float = 0.75,
+        max_vector_score: float = 0.90,
+        max_model_score: float = 0.90,
+        check_heuristic: bool = True,
+        check_vector: bool = True,
+        check_llm: bool = True,
+        chunk_tokens: int = 512,
+        chunk_overlap_tokens: int = 64,
+        max_chunks: Optional[int] = 32,
+        max_workers: int = 4,
+        check_classifier: bool = False,
+        max_classifier_score: float = 0.90,
+    ) -> RebuffDetectionResponse:
+        """
+        Detects injection attempts in a long document by scoring overlapping token-bounded chunks of it.
 
-        else:
-            rebuff_vector_score = 0
+        Each enabled tactic scores every chunk, with up to max_workers chunk scores running concurrently. The
+        document's score for a tactic is the highest score of any of its chunks. Scoring stops as soon as any chunk
+        goes over a threshold, so a malicious document usually costs far less than a full scan.
 
-        if check_llm:
-            rendered_input = render_prompt_for_pi_detection(user_input)
-            model_response = call_openai_to_detect_pi(
-                rendered_input, self.openai_model, self.openai_apikey
-            )
+        Args:
+            user_input (str): The document to be checked for injection.
+            max_heuristic_score (float, optional): The maximum heuristic score allowed. Defaults to 0.75.
+            max_vector_score (float, optional): The maximum vector score allowed. Defaults to 0.90.
+            max_model_score (float, optional): The maximum model (LLM) score allowed. Defaults to 0.90.
+            check_heuristic (bool, optional): Whether to run the heuristic check. Defaults to True.
+            check_vector (bool, optional): Whether to run the vector check. Defaults to True.
+            check_llm (bool, optional): Whether to run the language model check. Defaults to True.
+            chunk_tokens (int, optional): The maximum number of tokens per chunk. Defaults to 512.
+            chunk_overlap_tokens (int, optional): The number of tokens shared by consecutive chunks. Defaults to 64.
+            max_chunks (Optional[int], optional): The maximum number of chunks to score. Chunks after it are not
+                scored, which caps the cost of a document; chunks_total and chunks_scored in the response show
+                whether that happened. Defaults to 32, about 14,000 tokens with the default chunk sizes. None scores
+                every chunk.
+            max_workers (int, optional): The maximum number of chunk scores running concurrently. Defaults to 4.
+            check_classifier (bool, optional): Whether to run the local classifier check, which needs
+                classifier_path. Defaults to False.
+            max_classifier_score (float, optional): The maximum classifier score allowed. Defaults to 0.90.
 
-            rebuff_model_score = float(model_response.get("completion", 0))
+        Returns:
+            RebuffDetectionResponse
+        """
+        if max_workers < 1:
+            raise ValueError("max_workers must be at least 1")
 
-        else:
-            rebuff_model_score = 0
+        chunks = chunk_text_by_tokens(user_input, chunk_tokens, chunk_overlap_tokens)
+        chunks_total = len(chunks)
+        if max_chunks is not None:
+            chunks = chunks[:max_chunks]
 
-        if (
-            rebuff_heuristic_score > max_heuristic_score
-            or rebuff_model_score > max_model_score
-            or rebuff_vector_score > max_vector_score
-        ):
-            injection_detected = True
+        if check_classifier:
+            self._ensure_classifier()
+        if check_vector:
+            self._ensure_vector_store()
+
+        # Submit chunk by chunk so that early chunks, which can stop the scan, are scored first
+        tasks: List[Tuple[int, str, Callable[[], float]]] = []
+        for chunk_index, chunk_text in enumerate(chunks):
+            chunk = PreparedInput(chunk_text)
+            if check_heuristic:
+                tasks.append(
+                    (chunk_index, "heuristic", partial(self._heuristic_score, chunk))
+                )
+            if check_classifier:
+                tasks.append(
+                    (
+                        chunk_index,
+                        "classifier",
+                        partial(self._classifier_score, chunk),
+                    )
+                )
+            if check_vector:
+                tasks.append(
+                    (
+                        chunk_index,
+                        "vector",
+                        partial(self._vector_score, chunk, max_vector_score),
+                    )
+                )
+            if check_llm:
+                tasks.append((chunk_index, "llm", partial(self._model_score, chunk)))
+
+        _, thresholds = tactic_settings(
+            check_heuristic,
+            check_classifier,
+            check_vector,
+            check_llm,
+            max_heuristic_score,
+            max_classifier_score,
+            max_vector_score,
+            max_model_score,
+        )
+        scores = {"heuristic": 0.0, "vector": 0.0, "llm": 0.0, "classifier": 0.0}
+        scored_chunks: Set[int] = set()
+        injection_detected = False
 
-        rebuff_response = RebuffDetectionResponse(
-            heuristic_score=rebuff_heuristic_score,
-            openai_score=rebuff_model_score,
-            vector_score=rebuff_vector_score,
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        futures = {
+            executor.submit(timed_wait(self.hooks, "chunk_queue", score)): (
+                chunk_index,
+                tactic,
+            )
+            for chunk_index, tactic, score in tasks
+        }
+        try:
+            for future in as_completed(futures):
+                chunk_index, tactic = futures[future]
+                scores[tactic] = max(scores[tactic], future.result())
+                scored_chunks.add(chunk_index)
+                if scores[tactic] > thresholds[tactic]:
+                    injection_detected = True
+                    break
+        finally:
+            # Drop the chunks that haven't started, the ones in progress are left to finish
+            for future in futures:
+                future.cancel()
+            executor.shutdown(wait=False)
+
+        return RebuffDetectionResponse(
+            heuristic_score=scores["heuristic"],
+            openai_score=scores["llm"],
+            vector_score=scores["vector"],
             run_heuristic_check=check_heuristic,
             run_language_model_check=check_llm,
             run_vector_check=check_vector,
@@ -122,8 +475,389 @@ class RebuffSdk:
             max_model_score=max_model_score,
             max_vector_score=max_vector_score,
             injection_detected=injection_detected,
+            classifier_score=scores["classifier"],
+            run_classifier_check=check_classifier,
+            max_classifier_score=max_classifier_score if check_classifier else None,
+            chunks_total=chunks_total,
+            chunks_scored=len(scored_chunks),
         )
-        return rebuff_response
+
+    @overload
+    def detect_stream(
+        self,
+        user_inputs: Iterable[str],
+        max_heuristic_score: float = ...,
+        max_vector_score: float = ...,
+        max_model_score: float = ...,
+        check_heuristic: bool = ...,
+        check_vector: bool = ...,
+        check_llm: bool = ...,
+        max_in_flight: int = ...,
+        ordered: bool = ...,
+        check_classifier: bool = ...,
+        max_classifier_score: float = ...,
+        tenant: Optional[str] = ...,
+    ) -> Iterator[RebuffDetectionResponse]:
+        ...
+
+    @overload
+    def detect_stream(
+        self,
+        user_inputs: AsyncIterable[str],
+        max_heuristic_score: float = ...,
+        max_vector_score: float = ...,
+        max_model_score: float = ...,
+        check_heuristic: bool = ...,
+        check_vector: bool = ...,
+        check_llm: bool = ...,
+        max_in_flight: int = ...,
+        ordered: bool = ...,
+        check_classifier: bool = ...,
+        max_classifier_score: float = ...,
+        tenant: Optional[str] = ...,
+    ) -> AsyncIterator[RebuffDetectionResponse]:
+        ...
+
+    def detect_stream(
+        self,
+        user_inputs: Union[Iterable[str], AsyncIterable[str]],
+        max_heuristic_score: float = 0.75,
+        max_vector_score: float = 0.90,
+        max_model_score: float = 0.90,
+        check_heuristic: bool = True,
+        check_vector: bool = True,
+        check_llm: bool = True,
+        max_in_flight: int = 8,
+        ordered: bool = True,
+        check_classifier: bool = False,
+        max_classifier_score: float = 0.90,
+        tenant: Optional[str] = None,
+    ) -> Union[
+        Iterator[RebuffDetectionResponse], AsyncIterator[RebuffDetectionResponse]
+    ]:
+        """
+        Detects injection attempts in a stream of user inputs, yielding a response for each as it is ready.
+
+        Inputs are pulled from the stream only while fewer than max_in_flight of them are being detected or waiting
+        to be yielded, so a slow consumer holds back the producer and memory stays bounded however long the stream
+        is. Each response's input_index is the position of its input in the stream.
+
+        Args:
+            user_inputs (Union[Iterable[str], AsyncIterable[str]]): The user inputs to be checked for injection. For
+                an async iterable, an async iterator of responses is returned.
+            max_heuristic_score (float, optional): The maximum heuristic score allowed. Defaults to 0.75.
+            max_vector_score (float, optional): The maximum vector score allowed. Defaults to 0.90.
+            max_model_score (float, optional): The maximum model (LLM) score allowed. Defaults to 0.90.
+            check_heuristic (bool, optional): Whether to run the heuristic check. Defaults to True.
+            check_vector (bool, optional): Whether to run the vector check. Defaults to True.
+            check_llm (bool, optional): Whether to run the language model check. Defaults to True.
+            max_in_flight (int, optional): The maximum number of inputs taken from the stream and not yet yielded.
+                Defaults to 8.
+            ordered (bool, optional): Whether to yield responses in input order. Otherwise they are yielded as soon
+                as they complete. Defaults to True.
+            check_classifier (bool, optional): Whether to run the local classifier check, which needs
+                classifier_path. Defaults to False.
+            max_classifier_score (float, optional): The maximum classifier score allowed. Defaults to 0.90.
+            tenant (Optional[str], optional): The tenant the inputs come from, passed to the sampling policies.
+
+        Returns:
+            Union[Iterator[RebuffDetectionResponse], AsyncIterator[RebuffDetectionResponse]]
+        """
+        if max_in_flight < 1:
+            raise ValueError("max_in_flight must be at least 1")
+
+        if check_classifier:
+            self._ensure_classifier()
+        if check_vector:
+            self._ensure_vector_store()
+
+        def detect(input_index: int, user_input: str) -> RebuffDetectionResponse:
+            response = self.detect_injection(
+                user_input,
+                max_heuristic_score=max_heuristic_score,
+                max_vector_score=max_vector_score,
+                max_model_score=max_model_score,
+                check_heuristic=check_heuristic,
+                check_vector=check_vector,
+                check_llm=check_llm,
+                check_classifier=check_classifier,
+                max_classifier_score=max_classifier_score,
+                tenant=tenant,
+            )
+            response.input_index = input_index
+            return response
+
+        if isinstance(user_inputs, AsyncIterable):
+            return self._detect_async_stream(
+                user_inputs, detect, max_in_flight, ordered
+            )
+        return self._detect_sync_stream(user_inputs, detect, max_in_flight, ordered)
+
+    def _detect_sync_stream(
+        self,
+        user_inputs: Iterable[str],
+        detect: Callable[[int, str], RebuffDetectionResponse],
+        max_in_flight: int,
+        ordered: bool,
+    ) -> Iterator[RebuffDetectionResponse]:
+        inputs = enumerate(user_inputs)
+        exhausted = False
+        pending: Deque["Future[RebuffDetectionResponse]"] = deque()
+        executor = ThreadPoolExecutor(max_workers=max_in_flight)
+        try:
+            while True:
+                while not exhausted and len(pending) < max_in_flight:
+                    next_input = next(inputs, None)
+                    if next_input is None:
+                        exhausted = True
+                    else:
+                        pending.append(
+                            executor.submit(
+                                timed_wait(self.hooks, "stream_queue", detect),
+                                *next_input,
+                            )
+                        )
+                if not pending:
+                    return
+
+                if ordered:
+                    future = pending.popleft()
+                else:
+                    wait(pending, return_when=FIRST_COMPLETED)
+                    future = next(f for f in pending if f.done())
+                    pending.remove(future)
+                # The generator is suspended here until the consumer asks for the next response
+                yield future.result()
+        finally:
+            # Drop the inputs that haven't started, the ones in progress are left to finish
+            for future in pending:
+                future.cancel()
+            executor.shutdown(wait=False)
+
+    async def _detect_async_stream(
+        self,
+        user_inputs: AsyncIterable[str],
+        detect: Callable[[int, str], RebuffDetectionResponse],
+        max_in_flight: int,
+        ordered: bool,
+    ) -> AsyncIterator[RebuffDetectionResponse]:
+        loop = asyncio.get_running_loop()
+        inputs = user_inputs.__aiter__()
+        input_index = 0
+        exhausted = False
+        pending: Deque["asyncio.Future[RebuffDetectionResponse]"] = deque()
+        executor = ThreadPoolExecutor(max_workers=max_in_flight)
+        try:
+            while True:
+                while not exhausted and len(pending) < max_in_flight:
+                    try:
+                        user_input = await inputs.__anext__()
+                    except StopAsyncIteration:
+                        exhausted = True
+                    else:
+                        pending.append(
+                            loop.run_in_executor(
+                                executor,
+                                timed_wait(self.hooks, "stream_queue", detect),
+                                input_index,
+                                user_input,
+                            )
+                        )
+                        input_index += 1
+                if not pending:
+                    return
+
+                if ordered:
+                    future = pending.popleft()
+                    await asyncio.wait([future])
+                else:
+                    await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    future = next(f for f in pending if f.done())
+                    pending.remove(future)
+                yield future.result()
+        finally:
+            for future in pending:
+                future.cancel()
+            executor.shutdown(wait=False)
+
+    def wait_for_shadow(self, timeout: Optional[float] = None) -> bool:
+        """
+        Waits for the shadow runs queued so far to finish, for example before shutting down or in tests.
+
+        Args:
+            timeout (Optional[float], optional): The maximum number of seconds to wait. Defaults to None, no limit.
+
+        Returns:
+            bool: Whether they all finished.
+        """
+        with self._shadow_lock:
+            futures = list(self._shadow_futures)
+        _, not_done = wait(futures, timeout)
+        return not not_done
+
+    def _score_input(
+        self,
+        prepared: PreparedInput,
+        checks: Mapping[str, bool],
+        thresholds: Mapping[str, float],
+        tenant: Optional[str],
+        timings: Optional[Dict[str, float]] = None,
+    ) -> Tuple[Dict[str, float], bool]:
+        """
+        Runs the checked and sampled tactics on an input, then submits its shadow tactics.
+
+        Returns:
+            Tuple[Dict[str, float], bool]: The score of each tactic that ran, by name, and whether any of them is over
+                its threshold.
+        """
+        scorers: Dict[str, Callable[..., float]] = {
+            "heuristic": partial(self._heuristic_score, prepared),
+            "classifier": partial(self._classifier_score, prepared),
+            "vector": partial(self._vector_score, prepared, thresholds["vector"]),
+            "llm": partial(self._model_score, prepared),
+        }
+
+        scores: Dict[str, float] = {}
+        for tactic in TACTICS:
+            if (
+                checks[tactic]
+                and tactic not in self.shadow_tactics
+                and self._is_sampled(tactic, prepared, scores, tenant)
+            ):
+                self._ensure_tactic(tactic)
+                scores[tactic] = float(scorers[tactic](timings))
+
+        injection_detected = any(
+            score > thresholds[tactic] for tactic, score in scores.items()
+        )
+
+        for tactic in self.shadow_tactics:
+            if checks[tactic] and self._is_sampled(tactic, prepared, scores, tenant):
+                self._ensure_tactic(tactic)
+                self._submit_shadow(
+                    tactic,
+                    scorers[tactic],
+                    thresholds[tactic],
+                    injection_detected,
+                    prepared,
+                    tenant,
+                )
+
+        return scores, injection_detected
+
+    def _is_sampled(
+        self,
+        tactic: str,
+        prepared: PreparedInput,
+        scores: Mapping[str, float],
+        tenant: Optional[str],
+    ) -> bool:
+        policy = self.sampling.get(tactic)
+        return policy is None or policy.should_run(tactic, prepared, scores, tenant)
+
+    def _ensure_tactic(self, tactic: str) -> None:
+        if tactic == "classifier":
+            self._ensure_classifier()
+        elif tactic == "vector":
+            self._ensure_vector_store()
+
+    def _submit_shadow(
+        self,
+        tactic: str,
+        score: Callable[[], float],
+        max_score: float,
+        injection_detected: bool,
+        prepared: PreparedInput,
+        tenant: Optional[str],
+    ) -> None:
+        def run_shadow() -> None:
+            # Errors are reported to the hooks by timed_tactic
+            shadow_score = float(score())
+            result = ShadowResult(
+                tactic=tactic,
+                score=shadow_score,
+                max_score=max_score,
+                shadow_detected=shadow_score > max_score,
+                injection_detected=injection_detected,
+                content_hash=prepared.content_hash,
+                tenant=tenant,
+            )
+            for hook in self.hooks:
+                hook.on_shadow_result(result)
+
+        with self._shadow_lock:
+            if len(self._shadow_futures) >= self.max_shadow_pending:
+                self.shadow_runs_dropped += 1
+                return
+            if self._shadow_executor is None:
+                self._shadow_executor = ThreadPoolExecutor(
+                    max_workers=self.shadow_workers, thread_name_prefix="rebuff-shadow"
+                )
+            future = self._shadow_executor.submit(
+                timed_wait(self.hooks, "shadow_queue", run_shadow)
+            )
+            self._shadow_futures.add(future)
+        future.add_done_callback(self._shadow_done)
+
+    def _shadow_done(self, future: "Future[None]") -> None:
+        with self._shadow_lock:
+            self._shadow_futures.discard(future)
+
+    def _ensure_vector_store(self) -> None:
+        for hook in self.hooks:
+            hook.on_cache("vector_store", self.vector_store is not None)
+        if self.vector_store is None:
+            self.initialize_pinecone()
+
+    def _ensure_classifier(self) -> None:
+        for hook in self.hooks:
+            hook.on_cache("classifier", self.classifier is not None)
+        if self.classifier is None:
+            if self.classifier_path is None:
+                raise ValueError("The classifier check needs a classifier_path")
+            self.classifier = PromptInjectionClassifier.load(self.classifier_path)
+
+    def _heuristic_score(
+        self, prepared: PreparedInput, timings: Optional[Dict[str, float]] = None
+    ) -> float:
+        with timed_tactic(self.hooks, "heuristic", len(prepared), timings):
+            return detect_prompt_injection_using_heuristic_on_input(prepared)
+
+    def _classifier_score(
+        self, prepared: PreparedInput, timings: Optional[Dict[str, float]] = None
+    ) -> float:
+        with timed_tactic(self.hooks, "classifier", len(prepared), timings):
+            # _ensure_classifier has loaded it
+            classifier = cast(PromptInjectionClassifier, self.classifier)
+            classifier_score = detect_pi_using_classifier(prepared, classifier)
+        return classifier_score["score"]
+
+    def _vector_score(
+        self,
+        prepared: PreparedInput,
+        max_vector_score: float,
+        timings: Optional[Dict[str, float]] = None,
+    ) -> float:
+        with timed_tactic(self.hooks, "vector", len(prepared), timings):
+            vector_score = detect_pi_using_vector_database(
+                prepared.text,
+                max_vector_score,
+                self.vector_store,
+                self.vector_top_k,
+                self.vector_score_threshold,
+            )
+        return float(vector_score["top_score"])
+
+    def _model_score(
+        self, prepared: PreparedInput, timings: Optional[Dict[str, float]] = None
+    ) -> float:
+        rendered_input = render_prompt_for_pi_detection(prepared.text)
+        with timed_tactic(self.hooks, "llm", len(prepared), timings):
+            model_response = call_openai_to_detect_pi(
+                rendered_input, self.openai_model, self.openai_apikey
+            )
+
+        return float(model_response.get("completion", 0))
 
     @staticmethod
     def generate_canary_word(length: int = 8) -> str:
@@ -140,10 +874,10 @@ class RebuffSdk:
 
     def add_canary_word(
         self,
-        prompt: Union[str, PromptTemplate],
+        prompt: Union[str, "PromptTemplate"],
         canary_word: Optional[str] = None,
         canary_format: str = "<!-- {canary_word} -->",
-    ) -> Tuple[Union[str, PromptTemplate], str]:
+    ) -> Tuple[Union[str, "PromptTemplate"], str]:
         """
         Adds a canary word to the given prompt which we will use to detect leakage.
 
@@ -167,7 +901,10 @@ class RebuffSdk:
             prompt_with_canary: str = canary_comment + "\n" + prompt
             return prompt_with_canary, canary_word
 
-        elif isinstance(prompt, PromptTemplate):
+        # Imported here so that using the SDK doesn't pay for importing LangChain
+        from langchain_core.prompts import PromptTemplate
+
+        if isinstance(prompt, PromptTemplate):
             prompt.template = canary_comment + "\n" + prompt.template
             return prompt, canary_word
 
@@ -8,7 +8,7 @@ import requests
 try:
     sys.path.insert(
         0,
-        os.path.abspath(os.path.join(os.path.dirname(__file__), "../rebuff")),
+        os.path.abspath(os.path.join(os.path.dirname(__file__), "..")),
     )
 except NameError:
     pass
@@ -17,6 +17,13 @@ import time
 
 import pytest
 
+from stubs import (
+    fake_vector_store,
+    make_sdk,
+    stub_api_server,
+    stub_openai_server,
+)
+
 
 # Define a fixture to manage the Next.js server's lifecycle
 @pytest.fixture(scope="session")
@@ -68,3 +75,21 @@ def fake_api_backend() -> Callable[[Any], Any]:
         return mock_response
 
     return _fake_api_backend
+
+
+# Define a fixture that replaces the tiktoken encoding with a byte-level one, so chunking tests run without
+# downloading the cl100k_base vocabulary
+@pytest.fixture
+def byte_level_encoding(monkeypatch: pytest.MonkeyPatch) -> Any:
+    import tiktoken
+
+    from rebuff import chunking
+
+    encoding = tiktoken.Encoding(
+        name="bytes",
+        pat_str=r"\S+|\s+",
+        mergeable_ranks={bytes([i]): i for i in range(256)},
+        special_tokens={},
+    )
+    monkeypatch.setattr(chunking, "get_encoding", lambda encoding_name: encoding)
+    return encoding
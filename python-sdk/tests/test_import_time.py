@@ -0,0 +1,52 @@
+import subprocess
+import sys
+from typing import Dict
+
+# Cumulative import time allowed for "from rebuff import Rebuff", in microseconds. Importing pydantic and requests
+# accounts for most of it; the budget is loose enough for slow CI machines.
+IMPORT_TIME_BUDGET_US = 1_000_000
+
+HEAVY_MODULES = [
+    "langchain",
+    "langchain_core",
+    "langchain_openai",
+    "openai",
+    "pinecone",
+]
+
+
+def import_times(statement: str) -> Dict[str, int]:
+    """
+    Runs the statement in a fresh interpreter with -X importtime and returns the cumulative import time of every
+    module it imported, in microseconds.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, module = line[len("import time:") :].split("|")
+        times[module.strip()] = int(cumulative)
+
+    return times
+
+
+def test_import_rebuff_is_fast() -> None:
+    times = import_times("from rebuff import Rebuff")
+
+    assert times["rebuff"] < IMPORT_TIME_BUDGET_US
+
+
+def test_import_rebuff_does_not_load_backends() -> None:
+    times = import_times(
+        "from rebuff import Rebuff, RebuffSdk, RebuffDetectionResponse"
+    )
+
+    loaded = [module for module in times if module.split(".")[0] in HEAVY_MODULES]
+    assert loaded == []
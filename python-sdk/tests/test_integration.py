@@ -7,7 +7,7 @@ import pytest
 try:
     sys.path.insert(
         0,
-        os.path.abspath(os.path.join(os.path.dirname(__file__), "../rebuff")),
+        os.path.abspath(os.path.join(os.path.dirname(__file__), "..")),
     )
 except NameError:
     pass
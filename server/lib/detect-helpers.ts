@@ -1,4 +1,5 @@
 import { NextApiRequest, NextApiResponse } from "next";
+import zlib from "zlib";
 import { pinecone } from "@/lib/pinecone-client";
 import stringSimilarity from "string-similarity";
 import { supabaseAdminClient } from "@/lib/supabase";
@@ -25,6 +26,63 @@ export function runMiddleware(
     });
   });
 }
+export class RequestBodyError extends Error {
+  status: number;
+
+  constructor(status: number, message: string) {
+    super(message);
+    this.name = this.constructor.name;
+    this.status = status;
+  }
+}
+
+// Read a JSON request body, decompressing it if the client sent it gzipped.
+// Routes using this must disable Next's built-in body parser.
+export async function readJsonBody(
+  req: NextApiRequest,
+  limitBytes: number = 1024 * 1024
+): Promise<any> {
+  const chunks: Buffer[] = [];
+  let size = 0;
+  for await (const chunk of req) {
+    size += chunk.length;
+    if (size > limitBytes) {
+      throw new RequestBodyError(413, "Request body too large");
+    }
+    chunks.push(chunk);
+  }
+
+  let body = Buffer.concat(chunks);
+  const encoding = (req.headers["content-encoding"] || "identity").toLowerCase();
+  // Node ships zstd from 22.15; on older runtimes zstd bodies get a 415 and
+  // clients resend them uncompressed
+  const zstdDecompressSync = (zlib as any).zstdDecompressSync;
+  if (encoding === "gzip") {
+    try {
+      body = zlib.gunzipSync(body, { maxOutputLength: 8 * limitBytes });
+    } catch (error) {
+      throw new RequestBodyError(400, "Invalid gzip body");
+    }
+  } else if (encoding === "zstd" && zstdDecompressSync) {
+    try {
+      body = zstdDecompressSync(body, { maxOutputLength: 8 * limitBytes });
+    } catch (error) {
+      throw new RequestBodyError(400, "Invalid zstd body");
+    }
+  } else if (encoding !== "identity") {
+    throw new RequestBodyError(415, `Unsupported content encoding: ${encoding}`);
+  }
+
+  if (body.length === 0) {
+    return {};
+  }
+  try {
+    return JSON.parse(body.toString("utf-8"));
+  } catch (error) {
+    throw new RequestBodyError(400, "Invalid JSON body");
+  }
+}
+
 async function deductCredits(
   apiKey: string,
   billingRate: number
@@ -56,10 +114,14 @@ async function deductCredits(
   return { success: true, message: "API key accepted and credits deducted" };
 }
 
+// Charges one billing rate per detection, in a single deduction so that a batch
+// is either charged in full or not at all
 export async function checkApiKeyAndReduceBalance(
-  apiKey: string
+  apiKey: string,
+  detections: number = 1
 ): Promise<{ success: boolean; message: string }> {
-  const billingRate = parseInt(getEnvironmentVariable("BILLING_RATE_INT_10K"));
+  const billingRate =
+    parseInt(getEnvironmentVariable("BILLING_RATE_INT_10K")) * detections;
 
   // Get the master credit amount from the environment variable
   if (process.env.MASTER_API_KEY && apiKey === process.env.MASTER_API_KEY) {
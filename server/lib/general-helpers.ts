@@ -15,6 +15,27 @@ export function normalizeString(str: string): string {
     .trim();
 }
 
+// Map items through an async function with at most `limit` calls in flight,
+// returning the results in input order
+export async function mapWithConcurrency<T, R>(
+  items: T[],
+  limit: number,
+  func: (item: T) => Promise<R>
+): Promise<R[]> {
+  const results: R[] = new Array(items.length);
+  let next = 0;
+  const worker = async () => {
+    while (next < items.length) {
+      const index = next++;
+      results[index] = await func(items[index]);
+    }
+  };
+  await Promise.all(
+    Array.from({ length: Math.min(limit, items.length) }, worker)
+  );
+  return results;
+}
+
 export async function tryUntilDeadline(
   deadline: number,
   funcPromise: Promise<any>,
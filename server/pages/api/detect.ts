@@ -4,13 +4,28 @@ import { rebuff } from "@/lib/rebuff";
 import {
   runMiddleware,
   checkApiKeyAndReduceBalance,
+  readJsonBody,
+  RequestBodyError,
 } from "@/lib/detect-helpers";
+import { mapWithConcurrency } from "@/lib/general-helpers";
 import { ApiFailureResponse } from "@types";
 
 const cors = Cors({
   methods: ["POST"],
 });
 
+// The most inputs accepted in one batch request, matching the client's default batch size
+const MAX_BATCH_SIZE = 100;
+// The most inputs of a batch checked at once, bounding the OpenAI and Pinecone calls in flight
+const BATCH_CONCURRENCY = 8;
+
+// The body is parsed by readJsonBody so that compressed requests are accepted
+export const config = {
+  api: {
+    bodyParser: false,
+  },
+};
+
 export default async function handler(
   req: NextApiRequest,
   res: NextApiResponse<any>
@@ -22,6 +37,18 @@ export default async function handler(
       message: "Method not allowed",
     } as ApiFailureResponse);
   }
+  let body;
+  try {
+    body = await readJsonBody(req);
+  } catch (error) {
+    if (error instanceof RequestBodyError) {
+      return res.status(error.status).json({
+        error: "bad_request",
+        message: error.message,
+      } as ApiFailureResponse);
+    }
+    throw error;
+  }
   try {
     // Extract the API key from the Authorization header
     const apiKey = req.headers.authorization?.split(" ")[1];
@@ -34,28 +61,75 @@ export default async function handler(
       } as ApiFailureResponse);
     }
 
-    // Check if the API key is valid and reduce the account balance
-    const { success, message } = await checkApiKeyAndReduceBalance(apiKey);
-
-    if (!success) {
-      return res.status(401).json({
-        error: "unauthorized",
-        message: message,
-      } as ApiFailureResponse);
-    }
-
     const {
+      userInput = "",
       userInputBase64,
+      userInputs,
+      userInputsBase64,
       runHeuristicCheck = true,
       runVectorCheck = true,
       runLanguageModelCheck = true,
       maxHeuristicScore = null,
       maxModelScore = null,
       maxVectorScore = null,
-    } = req.body;
+    } = body;
+    // Compact clients send the raw text once instead of the hex encoding
+    const batchInputs: { userInput: string; userInputBase64: string }[] | null =
+      Array.isArray(userInputsBase64)
+        ? userInputsBase64.map((encodedInput: string) => ({
+            userInput: "",
+            userInputBase64: encodedInput,
+          }))
+        : Array.isArray(userInputs)
+        ? userInputs.map((input: string) => ({
+            userInput: input,
+            userInputBase64: "",
+          }))
+        : null;
+
+    if (batchInputs && batchInputs.length > MAX_BATCH_SIZE) {
+      return res.status(400).json({
+        error: "bad_request",
+        message: `A batch can hold at most ${MAX_BATCH_SIZE} inputs`,
+      } as ApiFailureResponse);
+    }
+
+    // Check if the API key is valid and reduce the account balance, by one
+    // credit per input of a batch
+    const { success, message } = await checkApiKeyAndReduceBalance(
+      apiKey,
+      batchInputs ? Math.max(batchInputs.length, 1) : 1
+    );
+
+    if (!success) {
+      return res.status(401).json({
+        error: "unauthorized",
+        message: message,
+      } as ApiFailureResponse);
+    }
+
     try {
+      if (batchInputs) {
+        // Results are returned in input order
+        const results = await mapWithConcurrency(
+          batchInputs,
+          BATCH_CONCURRENCY,
+          (input) =>
+            rebuff.detectInjection({
+              ...input,
+              runHeuristicCheck,
+              runVectorCheck,
+              runLanguageModelCheck,
+              maxHeuristicScore,
+              maxModelScore,
+              maxVectorScore,
+            })
+        );
+        return res.status(200).json({ results });
+      }
+
       const resp = await rebuff.detectInjection({
-        userInput: "",
+        userInput,
         userInputBase64,
         runHeuristicCheck,
         runVectorCheck,